@@ -1,25 +1,68 @@
+import time
+# 启动计时从这里开始，包含导入其余模块的时间
+_STARTED = time.perf_counter()
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 from datetime import datetime
-from db_operations import DatabaseManager
-import pystray
-from PIL import Image, ImageGrab, ImageTk
+from db_operations import (DatabaseManager, HIGHLIGHT_OPEN, SEARCH_LIMIT, narrow_search_results,
+                           sqlite_version_error, uses_full_text_index)
+from note_list import VirtualNoteList
+from note_loader import NoteLoader
+from preview_cache import PreviewCache
+from image_utils import encode_png, fit_image
+from tk_dispatch import TkDispatcher
+from hotkey_queue import HotkeyQueue
+from write_worker import WriteWorker
+from search_worker import SearchWorker
+from fuzzy_index import TitleIndex
+from image_index import ImageHashIndex
+from backends import load_backends
+from startup_timing import StartupTimer
+from perf_trace import StallMonitor, Tracer
+from backup import BackupScheduler, export_notes
+from maintenance import MaintenanceScheduler, format_storage_stats
+from clipboard_history import ClipboardWatcher
+from PIL import Image, ImageTk
 import io
-from pynput import keyboard
-import win32clipboard
-import win32api
-import win32gui
-import win32ui
-import win32con
-import pyperclip
 import threading
 import os
-import numpy as np
 import sys
 
+# 预览区大小停止变化多久之后进行高质量缩放（毫秒）
+RESIZE_DEBOUNCE_MS = 150
+# 输入搜索词停顿多久之后更新搜索结果（毫秒）
+SEARCH_DEBOUNCE_MS = 80
+# 全文搜索结果少于这个数量时，补充标题的模糊匹配结果
+FUZZY_MIN_RESULTS = 10
+# 开启性能跟踪时记录耗时的主界面方法
+TRACED_HANDLERS = ('handle_hotkey', 'handle_screenshot', 'handle_selected_text', 'handle_direct_input',
+                   'focus_search', 'delete_note', 'on_select', '_on_preview_resize',
+                   '_finish_preview_resize', 'create_save_dialog', 'create_text_save_dialog',
+                   'create_direct_input_dialog', 'refresh_notes', 'search_notes', 'on_note_saved',
+                   'find_similar_images', 'copy_image_to_clipboard', 'save_text_content')
+# 不跟踪的数据库方法：连接管理和启动时的迁移
+UNTRACED_DB_METHODS = ('get_connection', 'close', 'init_db', 'migrate')
+# 性能面板的刷新间隔（毫秒）
+PERF_PANEL_REFRESH_MS = 1000
+# 删除笔记后分步释放空间时，两步之间的间隔（毫秒）
+VACUUM_STEP_INTERVAL_MS = 50
+# 定格截图时，主窗口隐藏后等待多久再截取屏幕（毫秒）
+FREEZE_HIDE_DELAY_MS = 150
+
 class NoteApp:
-    def __init__(self, root):
+    def __init__(self, root, timer=None, tracer=None, freeze_capture=True, clipboard_history=False):
         self.root = root
+        self.clipboard_history = clipboard_history
+        # 定格截图：按下快捷键时先截取整个屏幕，再在定格的画面上选择区域
+        self.freeze_capture = freeze_capture
+        self._screen_frame = None
+        # 正在选择截图区域（包括定格前隐藏主窗口的等待），期间不再响应快捷键
+        self._selecting_area = False
+        self.timer = timer or StartupTimer(_STARTED)
+        # 性能跟踪默认关闭；开启时在绑定事件之前替换需要跟踪的方法
+        self.tracer = tracer or Tracer()
+        self.tracer.instrument(self, TRACED_HANDLERS, 'app')
+        self.encode_png = self.tracer.wrap(encode_png, 'image.encode_png')
         self.root.title("FastNote - 快速笔记")
         self.root.geometry("1000x700")
         self.root.minsize(900, 650)
@@ -33,6 +76,22 @@ class NoteApp:
         
         # 初始化数据库
         self.db = DatabaseManager()
+        self.timer.mark("打开数据库")
+        self.tracer.instrument(self.db, [name for name in dir(self.db)
+                                         if not name.startswith('_') and name not in UNTRACED_DB_METHODS
+                                         and callable(getattr(self.db, name))], 'db')
+        
+        # 截图、剪贴板和全局快捷键的平台实现，相关模块在第一次使用时才导入
+        self.capture, self.clipboard, self.hotkeys = load_backends()
+        self.tracer.instrument(self.capture, ('grab', 'grab_frame'), 'capture')
+        
+        # 已解码预览图片的缓存
+        self.preview_cache = PreviewCache()
+        
+        # 标题的模糊搜索索引，随笔记列表在后台加载时建立
+        self.title_index = TitleIndex()
+        # 图片感知哈希的索引，用于查找相似的截图
+        self.image_index = ImageHashIndex()
         
         # 创建系统托盘图标变量
         self.icon = None
@@ -112,7 +171,7 @@ class NoteApp:
         self.search_button.pack(side=tk.RIGHT, padx=(0, 5))
         
         # 创建快捷键提示标签（放在搜索框下方）
-        shortcut_text = "快捷键： Ctrl+Alt+1 截图 | Ctrl+Alt+2 剪切文本 | Ctrl+Alt+3 输入 | Ctrl+Alt+F 搜索 | Ctrl+D 删除 | Ctrl+S 保存 | Tab 切换工作区域 | ESC 取消选择/最小化至托盘 | jk上下选择"
+        shortcut_text = "快捷键： Ctrl+Alt+1 截图 | Ctrl+Alt+2 剪切文本 | Ctrl+Alt+3 输入 | Ctrl+Alt+F 搜索 | Ctrl+D 删除 | Ctrl+S 保存 | Tab 切换工作区域 | ESC 取消选择/最小化至托盘 | jk上下选择 | s 相似图片"
         self.shortcut_label = ttk.Label(search_area, text=shortcut_text, 
                                       font=('Microsoft YaHei UI', 9), 
                                       foreground='#666666')
@@ -121,6 +180,16 @@ class NoteApp:
         # 绑定回车键到搜索功能
         self.search_entry.bind('<Return>', lambda e: self.search_notes())
         
+        # 输入时实时更新搜索结果，连续输入时合并为一次查询
+        self._search_job = None
+        # 上一次搜索的 (搜索词, 结果)，继续输入时在其中筛选；笔记变化后版本号加一，
+        # 变化之前发出的搜索返回时不再写入缓存
+        self._last_search = None
+        self._search_cache_version = 0
+        # 按回车搜索时，结果显示后选中第一条
+        self._select_first_result = False
+        self.search_var.trace_add('write', self._on_search_changed)
+        
         # 创建主内容区域
         content_frame = ttk.Frame(main_container, style='TFrame')
         content_frame.pack(fill=tk.BOTH, expand=True)
@@ -146,6 +215,16 @@ class NoteApp:
                                       command=self.delete_note, width=6)
         self.delete_button.pack(side=tk.RIGHT)
         
+        # 添加查找相似图片按钮
+        self.similar_button = ttk.Button(list_header, text="相似", 
+                                       command=self.find_similar_images, width=6)
+        self.similar_button.pack(side=tk.RIGHT, padx=(0, 5))
+        
+        # 添加导出按钮
+        self.export_button = ttk.Button(list_header, text="导出", 
+                                      command=self.export_notes_to_zip, width=6)
+        self.export_button.pack(side=tk.RIGHT, padx=(0, 5))
+        
         # 创建分隔线
         separator1 = ttk.Separator(self.list_content, orient='horizontal')
         separator1.pack(fill=tk.X, padx=15, pady=(0, 10))
@@ -176,11 +255,13 @@ class NoteApp:
         
         # 添加滚动条
         scrollbar = ttk.Scrollbar(tree_container, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
         
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
+        # 列表只保留视口附近的笔记，滚动时分页加载
+        self.note_list = VirtualNoteList(self.tree, scrollbar, self.db)
+        
         # 创建右侧预览区域（占比65%）
         self.preview_frame = ttk.Frame(content_frame, style='Normal.TFrame')
         self.preview_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(10, 0), pady=0)
@@ -232,12 +313,67 @@ class NoteApp:
                                    foreground='#666666')
         self.focus_label.pack(side=tk.LEFT)
         
+        # 后台写入状态提示
+        self.write_status_label = ttk.Label(status_bar, text="", 
+                                          font=('Microsoft YaHei UI', 9), 
+                                          foreground='#666666')
+        self.write_status_label.pack(side=tk.RIGHT)
+        
+        # 后台加载笔记列表的进度
+        self.load_status_label = ttk.Label(status_bar, text="", 
+                                         font=('Microsoft YaHei UI', 9), 
+                                         foreground='#666666')
+        self.load_status_label.pack(side=tk.RIGHT, padx=(0, 15))
+        
+        # 自动备份和导出的状态
+        self.backup_status_label = ttk.Label(status_bar, text="", 
+                                           font=('Microsoft YaHei UI', 9), 
+                                           foreground='#666666')
+        self.backup_status_label.pack(side=tk.RIGHT, padx=(0, 15))
+        
+        # 性能面板，默认隐藏，按F12显示
+        self.perf_panel = ttk.Frame(main_container, style='TFrame')
+        perf_buttons = ttk.Frame(self.perf_panel, style='TFrame')
+        perf_buttons.pack(side=tk.RIGHT, fill=tk.Y, padx=(10, 0))
+        ttk.Button(perf_buttons, text="导出跟踪", command=self.export_trace).pack(side=tk.TOP)
+        self.perf_text = tk.Text(self.perf_panel, height=12, font=('Consolas', 9), 
+                                 wrap=tk.NONE, state='disabled', relief='flat')
+        self.perf_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._perf_job = None
+        self.root.bind('<F12>', self.toggle_perf_panel)
+        
+        # 后台线程通过dispatcher回到主线程；保存笔记在后台写入线程中完成
+        self.dispatcher = TkDispatcher(self.root)
+        self.writer = WriteWorker(self.dispatcher, on_status=self.update_write_status)
+        # 搜索在后台线程中查询，连续输入时只显示最后一次的结果
+        self.searcher = SearchWorker(self.dispatcher, self._search, self._on_search_results)
+        # 快捷键的监听线程只通过dispatcher把事件交给主线程，由主线程处理并统计响应时间
+        self.hotkey_queue = HotkeyQueue(self.dispatcher, {
+            'screenshot': lambda: self.handle_hotkey(self.handle_screenshot, show=False),
+            'selected_text': lambda: self.handle_hotkey(self.handle_selected_text),
+            'direct_input': lambda: self.handle_hotkey(self.handle_direct_input),
+            'search': lambda: self.handle_hotkey(self.focus_search),
+            'delete': lambda: self.handle_hotkey(self.delete_note, require_focus=True),
+        }, is_busy=self._dialog_open, tracer=self.tracer)
+        # 定时在后台把数据库备份到 backups/ 目录，之后每次只同步变化的部分
+        self.backups = BackupScheduler(self.root, self.dispatcher, self.db.db_file,
+                                       on_status=self.update_backup_status)
+        self._exporting = False
+        self._reclaim_pending = False
+        # 隐藏到托盘空闲一段时间后在后台维护数据库，窗口显示或按下快捷键时立即停止
+        self.maintenance = MaintenanceScheduler(self.root, self.db)
+        # 可选的剪贴板历史：在后台把复制的文本和图片保存为笔记
+        self.clipboard_watcher = ClipboardWatcher(self.clipboard, self.db, self.writer,
+                                                  on_saved=self.on_notes_added,
+                                                  on_error=self.on_save_failed)
+        
         # 底部状态栏不再需要快捷键提示标签，已移至搜索框下方
         
         # 绑定选择事件和焦点事件
         self.tree.bind('<<TreeviewSelect>>', self.on_select)
         self.tree.bind('j', self.select_next_note)
         self.tree.bind('k', self.select_prev_note)
+        self.tree.bind('s', self.find_similar_images)
         self.tree.bind('<Return>', self.focus_preview)
         self.tree.bind('<Tab>', self.focus_preview)
         self.tree.bind('<FocusOut>', lambda e: self.check_focus_widget())
@@ -247,11 +383,17 @@ class NoteApp:
         self.preview_content.bind('<Escape>', self.clear_selection)  # 添加ESC键取消选中功能
         self.preview_content.bind('<FocusOut>', lambda e: self.check_focus_widget())
         
-        # 绑定窗口大小改变事件
+        # 绑定窗口大小改变事件，拖动时的多次事件合并后再高质量缩放
+        self._preview_size = None
+        self._resize_job = None
         self.preview_frame.bind("<Configure>", self._on_preview_resize)
         
-        # 初始化显示
-        self.refresh_notes()
+        # 笔记列表在后台逐批加载，窗口不必等待读完所有笔记；
+        # 同时用读出的标题建立模糊搜索索引
+        self.note_list.start_streaming()
+        self.loader = NoteLoader(self.db, self.dispatcher, self._on_notes_loaded,
+                                 on_done=self._on_notes_load_done, on_page=self.title_index.build)
+        self.loader.start()
         
         # 设置关闭窗口的行为
         self.root.protocol('WM_DELETE_WINDOW', self.minimize_to_tray)
@@ -259,16 +401,40 @@ class NoteApp:
         # 绑定ESC键处理
         self.root.bind('<Escape>', self.handle_escape_key)
         
-        # 创建系统托盘图标
-        self.create_tray_icon()
+        self.timer.mark("创建界面")
         
-        # 启动托盘图标线程
-        self.tray_thread = threading.Thread(target=self.icon.run, daemon=True)
-        self.tray_thread.start()
+        # 托盘图标、快捷键和后台任务在窗口第一次绘制之后再启动
+        self.root.after_idle(self._start_services)
+    
+    def _start_services(self):
+        self.timer.mark("首次绘制")
+        
+        # 开启性能跟踪时检测主线程卡顿
+        if self.tracer.enabled:
+            self.stall_monitor = StallMonitor(self.root, self.tracer)
+            self.stall_monitor.start()
         
         # 启动快捷键监听线程
         self.hotkey_thread = threading.Thread(target=self.start_hotkey_listener, daemon=True)
         self.hotkey_thread.start()
+        
+        # 启动托盘图标线程
+        self.tray_thread = threading.Thread(target=self.run_tray_icon, daemon=True)
+        self.tray_thread.start()
+        
+        # 在后台为旧数据库中的图片补充生成缩略图
+        self.backfill_thread = threading.Thread(target=self.db.backfill_renditions, daemon=True)
+        self.backfill_thread.start()
+        
+        # 在后台补充计算旧图片的感知哈希，并建立相似图片索引
+        self.image_index_thread = threading.Thread(target=self._build_image_index, daemon=True)
+        self.image_index_thread.start()
+        
+        # 定时自动备份
+        self.backups.start()
+        
+        if self.clipboard_history and not self.clipboard_watcher.start():
+            print("当前平台的剪贴板不支持检测变化，剪贴板历史未启动")
     
     def create_tray_icon(self):
         # 创建一个简单的图标
@@ -278,27 +444,49 @@ class NoteApp:
                 <text x="32" y="42" font-family="Arial" font-size="40" fill="white" text-anchor="middle">N</text>
             </svg>
         '''
+        import pystray
         image = Image.open("FastNote.ico")
         # 创建菜单项
-        menu = (pystray.MenuItem('显示', self.show_window),
-                pystray.MenuItem('退出', self.quit_window))
+        # 菜单的回调在托盘线程中执行，都转交给主线程
+        menu = (pystray.MenuItem('显示', lambda: self.dispatcher.post(self.show_window)),
+                pystray.MenuItem('立即备份', lambda: self.dispatcher.post(self.backups.run_now)),
+                pystray.MenuItem('存储统计', lambda: self.dispatcher.post(self.show_storage_stats)),
+                pystray.MenuItem('剪贴板历史', lambda: self.dispatcher.post(self.toggle_clipboard_history),
+                                 checked=lambda item: self.clipboard_watcher.running),
+                pystray.MenuItem('退出', lambda: self.dispatcher.post(self.quit_window)))
         
         # 创建图标
         self.icon = pystray.Icon('fastnote', image, 'FastNote', menu)
     
-    def handle_hotkey(self, callback, require_focus=False):
+    def run_tray_icon(self):
+        # 在托盘线程中创建并运行图标，导入pystray不占用主线程
+        self.create_tray_icon()
+        self.timer.mark("托盘图标")
+        self.icon.run()
+    
+    def handle_hotkey(self, callback, require_focus=False, show=True):
+        # 由快捷键队列在主线程中调用
         # 如果需要焦点但窗口没有显示或没有焦点，则不执行操作
         if require_focus:
             # 检查窗口是否可见且有焦点
             if not self.root.winfo_viewable() or not self.root.focus_displayof():
                 return
-        # 如果窗口被隐藏，则显示窗口
-        elif not self.root.winfo_viewable():
+        # 如果窗口被隐藏，则显示窗口（截图时不显示，避免挡住要截取的画面）
+        elif show and not self.root.winfo_viewable():
             self.root.deiconify()
             # 将窗口移到屏幕中央
             self.center_window()
-        # 使用after确保在主线程中执行回调
-        self.root.after(10, callback)
+        callback()
+    
+    def _dialog_open(self):
+        # 有模态对话框或者正在选择截图区域
+        return self.root.grab_current() is not None or self._selecting_area
+    
+    def _on_hotkey(self, name):
+        # 在快捷键的监听线程中调用，只能使用线程安全的操作
+        # 按下快捷键时立即停止后台维护，避免与接下来的操作争用数据库
+        self.maintenance.interrupt()
+        self.hotkey_queue.post(name)
     
     def center_window(self):
         # 获取屏幕尺寸
@@ -315,14 +503,18 @@ class NoteApp:
     
     def start_hotkey_listener(self):
         # 设置快捷键监听
-        with keyboard.GlobalHotKeys({
-            '<ctrl>+<alt>+1': lambda: self.handle_hotkey(self.handle_screenshot),  # 截图保存
-            '<ctrl>+<alt>+2': lambda: self.handle_hotkey(self.handle_selected_text),  # 选中文本保存
-            '<ctrl>+<alt>+3': lambda: self.handle_hotkey(self.handle_direct_input),  # 直接输入保存
-            '<ctrl>+<alt>+f': lambda: self.handle_hotkey(self.focus_search),  # 聚焦搜索框
-            '<ctrl>+d': lambda: self.handle_hotkey(self.delete_note, require_focus=True)  # 删除笔记（需要窗口有焦点）
-        }) as h:
-            h.join()
+        try:
+            self.hotkeys.start({
+                '<ctrl>+<alt>+1': lambda: self._on_hotkey('screenshot'),  # 截图保存
+                '<ctrl>+<alt>+2': lambda: self._on_hotkey('selected_text'),  # 选中文本保存
+                '<ctrl>+<alt>+3': lambda: self._on_hotkey('direct_input'),  # 直接输入保存
+                '<ctrl>+<alt>+f': lambda: self._on_hotkey('search'),  # 聚焦搜索框
+                '<ctrl>+d': lambda: self._on_hotkey('delete')  # 删除笔记（需要窗口有焦点）
+            })
+        except Exception as e:
+            print(f"注册快捷键失败: {e}")
+            return
+        self.timer.mark("注册快捷键")
     
     def create_save_dialog(self, screenshot):
         # 确保主窗口可见并在最前
@@ -363,22 +555,15 @@ class NoteApp:
             dialog.focus_force()
             title_entry.focus_set()
         dialog.after(100, ensure_focus)
+        dialog.after_idle(self.hotkey_queue.mark_shown)
         
         def save():
             title = title_var.get().strip()
             if title:
-                # 保存截图到临时文件
-                temp_path = "temp_screenshot.png"
-                screenshot.save(temp_path)
-                
-                # 读取图片内容
-                with open(temp_path, 'rb') as f:
-                    content = f.read()
-                
-                # 保存到数据库
-                self.db.add_note(title, content, note_type='image')
-                self.refresh_notes()
+                # 立即关闭对话框，PNG编码和写入数据库在后台完成
                 dialog.destroy()
+                self.writer.submit(lambda: self.db.add_note(title, self.encode_png(screenshot), note_type='image'),
+                                   on_done=self.on_note_saved, on_error=self.on_save_failed)
             else:
                 messagebox.showwarning("提示", "请输入标题！", parent=dialog)
         
@@ -403,74 +588,42 @@ class NoteApp:
         # 绑定ESC键为取消
         dialog.bind('<Escape>', lambda e: cancel())
     
-    def capture_screen_area(self, x1, y1, x2, y2):
-        """使用pywin32捕获屏幕区域，支持多显示器"""
-        try:
-            # 获取桌面窗口句柄
-            hwnd = win32gui.GetDesktopWindow()
-            # 获取设备上下文
-            hwndDC = win32gui.GetWindowDC(hwnd)
-            mfcDC = win32ui.CreateDCFromHandle(hwndDC)
-            saveDC = mfcDC.CreateCompatibleDC()
-            
-            # 创建位图对象
-            saveBitMap = win32ui.CreateBitmap()
-            width = x2 - x1
-            height = y2 - y1
-            saveBitMap.CreateCompatibleBitmap(mfcDC, width, height)
-            saveDC.SelectObject(saveBitMap)
-            
-            # 复制屏幕区域到位图
-            saveDC.BitBlt((0, 0), (width, height), mfcDC, (x1, y1), win32con.SRCCOPY)
-            
-            # 将位图转换为PIL Image对象
-            bmpinfo = saveBitMap.GetInfo()
-            bmpstr = saveBitMap.GetBitmapBits(True)
-            img = Image.frombuffer(
-                'RGB',
-                (bmpinfo['bmWidth'], bmpinfo['bmHeight']),
-                bmpstr, 'raw', 'BGRX', 0, 1)
-            
-            # 清理资源
-            saveDC.DeleteDC()
-            mfcDC.DeleteDC()
-            win32gui.ReleaseDC(hwnd, hwndDC)
-            win32gui.DeleteObject(saveBitMap.GetHandle())
-            
-            return img
-        except Exception as e:
-            print(f"截图失败: {e}")
-            # 如果pywin32方法失败，回退到PIL的ImageGrab
-            return ImageGrab.grab(bbox=(x1, y1, x2, y2))
-    
     def get_virtual_screen_size(self):
         """获取虚拟屏幕尺寸（包括所有显示器）"""
-        try:
-            # 使用EnumDisplayMonitors获取所有显示器信息
-            monitors = win32api.EnumDisplayMonitors(None, None)
-            
-            # 初始化虚拟屏幕的边界
-            left = top = sys.maxsize
-            right = bottom = -sys.maxsize
-            
-            # 遍历所有显示器，找出整个虚拟屏幕的边界
-            for monitor in monitors:
-                monitor_info = win32api.GetMonitorInfo(monitor[0])
-                monitor_rect = monitor_info['Monitor']
-                
-                # 更新虚拟屏幕边界
-                left = min(left, monitor_rect[0])
-                top = min(top, monitor_rect[1])
-                right = max(right, monitor_rect[2])
-                bottom = max(bottom, monitor_rect[3])
-            
-            return (right - left, bottom - top, left, top)
-        except Exception as e:
-            print(f"获取虚拟屏幕尺寸失败: {e}")
+        size = self.capture.virtual_screen()
+        if size is None:
             # 如果失败，回退到tkinter的方法
             return (self.root.winfo_screenwidth(), self.root.winfo_screenheight(), 0, 0)
+        return size
     
     def handle_screenshot(self):
+        self._selecting_area = True
+        if not self.freeze_capture:
+            self._select_screen_area(None)
+            return
+        if self.root.winfo_viewable():
+            # 先隐藏主窗口，等它从屏幕上消失后再截取
+            self.root.withdraw()
+            self.root.after(FREEZE_HIDE_DELAY_MS, self._freeze_screen)
+        else:
+            self._freeze_screen()
+    
+    def _freeze_screen(self):
+        """立即截取整个虚拟屏幕，之后在这一帧上选择区域，直接从内存中裁剪
+
+        截图时屏幕上的提示框和菜单原样保留；整屏的图片在多次截图之间重复使用
+        """
+        try:
+            self._screen_frame = self.capture.grab_frame(self._screen_frame)
+        except Exception as e:
+            print(f"截取屏幕失败: {e}")
+            self._selecting_area = False
+            self.root.deiconify()
+            return
+        self._select_screen_area(self._screen_frame)
+    
+    def _select_screen_area(self, frame):
+        """显示全屏遮罩选择截图区域；frame为None时在松开鼠标后再截取选中的区域"""
         # 隐藏主窗口
         self.root.withdraw()
 
@@ -491,14 +644,33 @@ class NoteApp:
         
         # 创建全屏遮罩窗口，覆盖整个虚拟屏幕
         overlay = tk.Toplevel()
-        overlay.attributes('-alpha', 0.3, '-topmost', True)
+        if frame is None:
+            overlay.attributes('-alpha', 0.3, '-topmost', True)
+        else:
+            # 定格模式下遮罩不透明，显示截取时的画面
+            overlay.attributes('-topmost', True)
+            virtual_width, virtual_height = frame.image.size
+            virtual_left, virtual_top = frame.left, frame.top
         overlay.geometry(f"{virtual_width}x{virtual_height}+{virtual_left}+{virtual_top}")
         overlay.overrideredirect(True)
+        # 遮罩关闭（完成或取消截图）后重新响应快捷键
+        self._selecting_area = True
+        def on_overlay_destroy(event):
+            if event.widget is overlay:
+                self._selecting_area = False
+        overlay.bind('<Destroy>', on_overlay_destroy)
+        overlay.after_idle(self.hotkey_queue.mark_shown)
         
         # 创建全屏画布
         canvas = tk.Canvas(overlay, width=virtual_width, height=virtual_height, 
                           highlightthickness=0, bg='gray')
         canvas.pack()
+        if frame is not None:
+            # PhotoImage需要保持引用，遮罩关闭时随画布一起释放
+            canvas.frozen_image = ImageTk.PhotoImage(frame.image)
+            canvas.create_image(0, 0, image=canvas.frozen_image, anchor=tk.NW)
+            # 遮罩不透明，需要获得焦点才能按ESC取消
+            overlay.focus_force()
         
         start_x = start_y = 0
         end_x = end_y = 0
@@ -546,8 +718,11 @@ class NoteApp:
                 hint_window.destroy()
                 overlay.destroy()
                 
-                # 使用pywin32捕获屏幕区域，支持多显示器
-                screenshot = self.capture_screen_area(start_x, start_y, end_x, end_y)
+                # 定格模式直接从内存中裁剪，否则现在截取屏幕区域，支持多显示器
+                if frame is not None:
+                    screenshot = frame.crop(start_x, start_y, end_x, end_y)
+                else:
+                    screenshot = self.capture.grab(start_x, start_y, end_x, end_y)
                 
                 # 显示保存对话框
                 self.create_save_dialog(screenshot)
@@ -607,13 +782,14 @@ class NoteApp:
             dialog.focus_force()
             title_entry.focus_set()
         dialog.after(100, ensure_focus)
+        dialog.after_idle(self.hotkey_queue.mark_shown)
         
         def save():
             title = title_var.get().strip()
             if title:
-                self.db.add_note(title, text, note_type='text')
-                self.refresh_notes()
                 dialog.destroy()
+                self.writer.submit(lambda: self.db.add_note(title, text, note_type='text'),
+                                   on_done=self.on_note_saved, on_error=self.on_save_failed)
             else:
                 messagebox.showwarning("提示", "请输入标题！", parent=dialog)
         
@@ -639,20 +815,11 @@ class NoteApp:
         dialog.bind('<Escape>', lambda e: cancel())
     
     def handle_selected_text(self):
-        # 尝试使用 pyperclip 获取剪贴板内容
         try:
-            text = pyperclip.paste()
-        except pyperclip.PyperclipException:
-            # 如果 pyperclip 失败，回退到 win32clipboard
-            try:
-                win32clipboard.OpenClipboard()
-                text = win32clipboard.GetClipboardData(win32clipboard.CF_TEXT)
-                if isinstance(text, bytes):
-                    text = text.decode('gbk')
-            except:
-                text = ""
-            finally:
-                win32clipboard.CloseClipboard()
+            text = self.clipboard.get_text()
+        except Exception as e:
+            print(f"读取剪贴板失败: {e}")
+            text = ""
         
         if text:
             # 显示保存对话框
@@ -697,6 +864,7 @@ class NoteApp:
             dialog.focus_force()
             title_entry.focus_set()
         dialog.after(100, ensure_focus)
+        dialog.after_idle(self.hotkey_queue.mark_shown)
         
         # 创建内容输入框
         ttk.Label(dialog, text="请输入内容：", font=('Microsoft YaHei UI', 12)).pack(pady=10)
@@ -707,9 +875,9 @@ class NoteApp:
             title = title_var.get().strip()
             content = content_text.get("1.0", tk.END).strip()
             if title and content:
-                self.db.add_note(title, content, note_type='text')
-                self.refresh_notes()
                 dialog.destroy()
+                self.writer.submit(lambda: self.db.add_note(title, content, note_type='text'),
+                                   on_done=self.on_note_saved, on_error=self.on_save_failed)
             else:
                 messagebox.showwarning("提示", "标题和内容不能为空！", parent=dialog)
         
@@ -751,6 +919,7 @@ class NoteApp:
     
     def minimize_to_tray(self):
         self.root.withdraw()  # 隐藏窗口
+        self.maintenance.on_idle()
         self.focus_label.config(text="")  # 清空焦点提示
         # 重置边框样式
         self.list_frame.configure(style='Normal.TFrame')
@@ -758,6 +927,7 @@ class NoteApp:
 
     
     def show_window(self):
+        self.maintenance.interrupt()
         self.root.deiconify()  # 显示窗口
         self.root.lift()  # 将窗口提升到最前
         self.center_window()  # 居中显示窗口
@@ -771,28 +941,273 @@ class NoteApp:
     def quit_window(self):
         if self.icon:
             self.icon.stop()
+        self.hotkeys.stop()
+        self.loader.cancel()
+        self.backups.stop()
+        self.maintenance.close()
+        # 停止记录剪贴板，攒下的内容交给写入队列，随后一起写完
+        self.clipboard_watcher.stop()
         self.root.quit()
+        # 等待尚未完成的写入，再关闭数据库连接，WAL日志会在最后一个连接关闭时合并回数据库文件
+        self.searcher.stop()
+        self.writer.stop()
+        self.db.close()
     
     def refresh_notes(self, search_text=None):
-        # 清空现有项目
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
         # 从数据库获取笔记
         if search_text:
-            notes = self.db.search_notes_by_title(search_text)
+            # 在后台线程中查询，结果在_on_search_results中显示
+            self.searcher.submit(search_text, self._last_search, self._search_cache_version)
+            return
+        
+        # 只加载第一页，其余的在滚动时加载；还没有返回的搜索结果不再显示
+        self.searcher.cancel()
+        self._last_search = None
+        self.note_list.reload()
+    
+    def _search(self, search_text, last, version):
+        """在搜索线程中查询，新的搜索词是上一次的延续时直接在上一次的结果中筛选
+
+        返回 (搜索词, 缓存版本, 可以继续筛选的全文搜索结果, 显示的结果, 显示的列值)
+        """
+        notes = None
+        if last and last[0] == search_text:
+            notes = last[1]
+        elif last and search_text.startswith(last[0]) and len(last[1]) < SEARCH_LIMIT \
+                and uses_full_text_index(search_text):
+            notes = narrow_search_results(last[1], search_text)
+        if notes is None:
+            notes = self.db.search_notes(search_text)
+        # 缓存中只保存全文搜索的结果，模糊匹配的结果不满足子串关系，不能继续筛选
+        shown = notes
+        if len(notes) < FUZZY_MIN_RESULTS:
+            shown = notes + self._fuzzy_search(search_text, {note[0] for note in notes})
+        # 全文搜索结果按相关度排序，标题中显示高亮和内容摘要
+        display_values = [(note[0], self._format_search_title(note), note[4], note[2], note[3])
+                          for note in shown]
+        return search_text, version, notes, shown, display_values
+    
+    def _on_search_results(self, result):
+        search_text, version, notes, shown, display_values = result
+        # 只缓存全文搜索的结果；一两个字的搜索词用LIKE查询，继续输入后要重新用全文索引查询
+        if version == self._search_cache_version and uses_full_text_index(search_text):
+            self._last_search = (search_text, notes)
+        self.note_list.show_rows(shown, display_values)
+        if self._select_first_result:
+            self._select_first_result = False
+            self._select_first_note()
+    
+    def _fuzzy_search(self, search_text, exclude):
+        """按标题模糊匹配，容忍拼写错误，结果排在全文搜索结果之后"""
+        note_ids = [note_id for note_id, score in self.title_index.search(search_text, FUZZY_MIN_RESULTS * 2)
+                    if note_id not in exclude]
+        return [note + (note[1], '', None, None) for note in self.db.get_notes_meta(note_ids)]
+    
+    def _invalidate_search_cache(self):
+        # 笔记新增、修改或删除后，缓存的搜索结果不能再用来筛选
+        self._last_search = None
+        self._search_cache_version += 1
+    
+    def _on_search_changed(self, *args):
+        # 取消还没有执行的查询，只保留最后一次输入
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DEBOUNCE_MS, self._run_incremental_search)
+    
+    def _run_incremental_search(self):
+        self._search_job = None
+        self._select_first_result = False
+        self.refresh_notes(self.search_var.get().strip())
+    
+    def on_note_saved(self, note_id):
+        """笔记新增或修改后，只更新列表中对应的一行"""
+        self.preview_cache.invalidate(note_id)
+        self._invalidate_search_cache()
+        note = self.db.get_note_meta(note_id)
+        if note:
+            self.title_index.add(note_id, note[1])
+            if note[4] == 'image':
+                dhash = self.db.get_image_hash(note_id)
+                if dhash is not None:
+                    self.image_index.add(note_id, dhash)
+            self.note_list.upsert_note(note)
+    
+    def on_notes_added(self, note_ids):
+        """剪贴板历史批量写入的笔记加入列表和搜索索引"""
+        for note_id in note_ids:
+            self.on_note_saved(note_id)
+    
+    def toggle_clipboard_history(self):
+        if self.clipboard_watcher.running:
+            self.clipboard_watcher.stop()
+        elif not self.clipboard_watcher.start():
+            messagebox.showinfo("提示", "当前平台的剪贴板不支持检测变化，无法记录剪贴板历史")
+        if self.icon:
+            self.icon.update_menu()
+    
+    def _on_notes_loaded(self, notes, loaded, total, has_more):
+        # 列表只显示最前面的几页，其余的在滚动时分页读取；搜索时列表不受影响。
+        # 列表显示满以后，后台只继续为剩下的笔记建立标题索引，不再把每批发送到主线程
+        if self.note_list.extend(notes, has_more):
+            self.load_status_label.config(text=f"正在加载笔记：{loaded}/{total}")
         else:
-            notes = self.db.get_all_notes()
+            self.loader.stop_batches()
+            if has_more:
+                self.load_status_label.config(text="正在建立搜索索引…")
+    
+    def _on_notes_load_done(self, loaded):
+        self.load_status_label.config(text="")
+        self.timer.mark(f"加载笔记列表（{loaded}条）")
+    
+    def toggle_perf_panel(self, event=None):
+        """显示或隐藏状态栏下方的性能面板"""
+        if self._perf_job is not None:
+            self.root.after_cancel(self._perf_job)
+            self._perf_job = None
+            self.perf_panel.pack_forget()
+            return
+        self.perf_panel.pack(fill=tk.X, pady=(5, 0))
+        self._refresh_perf_panel()
+    
+    def _refresh_perf_panel(self):
+        if not self.tracer.enabled:
+            lines = ["性能跟踪未开启，使用 --trace 参数或设置环境变量 FASTNOTE_TRACE=1 启动后可以查看"]
+        else:
+            lines = [f"{'操作':<40}{'次数':>8}{'p50 ms':>10}{'p99 ms':>10}{'最大 ms':>10}"]
+            for name, count, p50, p99, max_ms, total_ms in self.tracer.stats():
+                lines.append(f"{name:<40}{count:>8}{p50:>10.2f}{p99:>10.2f}{max_ms:>10.1f}")
+            stalls = self.tracer.recent_stalls()
+            if stalls:
+                lines.append("")
+                lines.append("最近的主线程卡顿：" + "  ".join(f"{at} {ms:.0f}ms" for at, ms in stalls[-8:]))
+        # 快捷键的响应时间不需要开启性能跟踪
+        hotkey_stats = self.hotkey_queue.stats()
+        if hotkey_stats:
+            lines.append("")
+            lines.append(f"{'快捷键（按下到显示）':<34}{'次数':>8}{'p50 ms':>10}{'p99 ms':>10}{'最大 ms':>10}")
+            for name, count, p50, p99, max_ms in hotkey_stats:
+                lines.append(f"{name:<40}{count:>8}{p50:>10.2f}{p99:>10.2f}{max_ms:>10.1f}")
+            lines.append(f"合并重复按键 {self.hotkey_queue.coalesced} 次，对话框打开时忽略 {self.hotkey_queue.dropped} 次")
+        self.perf_text.config(state='normal')
+        self.perf_text.delete('1.0', tk.END)
+        self.perf_text.insert('1.0', "\n".join(lines))
+        self.perf_text.config(state='disabled')
+        self._perf_job = self.root.after(PERF_PANEL_REFRESH_MS, self._refresh_perf_panel)
+    
+    def export_trace(self):
+        """把最近的跟踪事件导出为Chrome trace-event格式的JSON文件"""
+        if not self.tracer.enabled:
+            messagebox.showinfo("提示", "性能跟踪未开启")
+            return
+        path = os.path.abspath(datetime.now().strftime('fastnote_trace_%Y%m%d_%H%M%S.json'))
+        try:
+            count = self.tracer.export_chrome_trace(path)
+        except OSError as e:
+            messagebox.showerror("错误", f"导出跟踪失败: {e}")
+            return
+        messagebox.showinfo("提示", f"已导出 {count} 个事件到\n{path}\n可以在 chrome://tracing 中打开")
+    
+    def on_save_failed(self, error):
+        messagebox.showerror("错误", f"保存笔记失败: {error}")
+    
+    def update_write_status(self, pending, failures):
+        """在状态栏显示后台写入队列的长度和失败次数"""
+        parts = []
+        if pending:
+            parts.append(f"正在保存：{pending}")
+        if failures:
+            parts.append(f"保存失败：{failures}")
+        self.write_status_label.config(text="  ".join(parts))
+    
+    def update_backup_status(self, text):
+        self.backup_status_label.config(text=text)
+    
+    def export_notes_to_zip(self):
+        """把所有笔记导出为zip文件，在后台线程中进行"""
+        if self._exporting:
+            messagebox.showinfo("提示", "正在导出，请稍候")
+            return
+        path = filedialog.asksaveasfilename(
+            title="导出笔记", defaultextension=".zip",
+            initialfile=datetime.now().strftime('FastNote_%Y%m%d.zip'),
+            filetypes=[("Zip 文件", "*.zip")])
+        if not path:
+            return
+        self._exporting = True
+        
+        def progress(done, total):
+            self.dispatcher.post(self.update_backup_status, f"正在导出：{done}/{total}")
+        
+        def run():
+            try:
+                count = export_notes(self.db.db_file, path, progress)
+            except Exception as e:
+                print(f"导出笔记失败: {e}")
+                self.dispatcher.post(self._on_export_done, None, str(e))
+                return
+            self.dispatcher.post(self._on_export_done, count, None)
         
-        # 添加笔记到列表
-        for note in notes:
-            display_values = (note[0], note[1], note[4], note[2], note[3])
-            self.tree.insert("", tk.END, values=display_values)
+        threading.Thread(target=run, name='FastNoteExport', daemon=True).start()
+    
+    def _on_export_done(self, count, error):
+        self._exporting = False
+        self.update_backup_status("")
+        if error:
+            messagebox.showerror("错误", f"导出笔记失败: {error}")
+        else:
+            messagebox.showinfo("提示", f"已导出 {count} 条笔记")
+    
+    def show_storage_stats(self):
+        """显示数据库的空间占用和后台维护的情况，统计在后台线程中进行"""
+        window = tk.Toplevel(self.root)
+        window.title("存储统计")
+        window.geometry("760x520")
+        text = tk.Text(window, font=('Consolas', 9), wrap=tk.NONE, relief='flat')
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        text.insert('1.0', "正在统计…")
+        text.config(state='disabled')
+        window.bind('<Escape>', lambda e: window.destroy())
+        
+        def show(lines):
+            if not window.winfo_exists():
+                return
+            text.config(state='normal')
+            text.delete('1.0', tk.END)
+            text.insert('1.0', "\n".join(lines))
+            text.config(state='disabled')
+        
+        def run():
+            try:
+                lines = format_storage_stats(self.db.get_storage_stats())
+            except Exception as e:
+                print(f"统计存储空间失败: {e}")
+                lines = [f"统计失败: {e}"]
+            lines += ["", "后台维护："] + ["  " + line for line in self.maintenance.describe()]
+            self.dispatcher.post(show, lines)
+        
+        threading.Thread(target=run, name='FastNoteStorageStats', daemon=True).start()
+    
+    def _format_search_title(self, note):
+        """搜索结果显示为 高亮标题 · 内容摘要（内容中有匹配时）"""
+        title_highlight, body_snippet = note[5], note[6]
+        if body_snippet and HIGHLIGHT_OPEN in body_snippet:
+            return f"{title_highlight} · {' '.join(body_snippet.split())}"
+        return title_highlight
     
     def search_notes(self):
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+            self._search_job = None
         search_text = self.search_var.get().strip()
-        self.refresh_notes(search_text)
-        # 搜索完成后，如果存在结果，则选中第一个
+        if search_text:
+            # 搜索完成后，如果存在结果，则选中第一个
+            self._select_first_result = True
+            self.refresh_notes(search_text)
+        else:
+            self.refresh_notes()
+            self._select_first_note()
+    
+    def _select_first_note(self):
         if self.tree.get_children():
             first_item = self.tree.get_children()[0]
             self.tree.selection_set(first_item)
@@ -814,11 +1229,48 @@ class NoteApp:
 
         current_item = current_selection[0]
         next_item = self.tree.next(current_item)
+        # 已经到达已加载部分的末尾时，加载下一页
+        if not next_item and self.note_list.load_next():
+            next_item = self.tree.next(current_item)
         if next_item:
             self.tree.selection_set(next_item)
             self.tree.focus(next_item)
             self.tree.see(next_item)
 
+    def _build_image_index(self):
+        # 先载入已有的哈希，补算完旧图片后再载入一次
+        self.image_index.build(self.db.get_image_hashes())
+        if self.db.backfill_image_hashes():
+            self.image_index.build(self.db.get_image_hashes())
+    
+    def find_similar_images(self, event=None):
+        """在列表中显示与选中图片相似的图片笔记，按相似程度排列"""
+        selected_items = self.tree.selection()
+        note = self.note_list.rows.get(selected_items[0]) if selected_items else None
+        if not note or note[4] != 'image':
+            messagebox.showwarning("提示", "请先选择一张图片笔记！")
+            return 'break'
+        dhash = self.image_index.get(note[0])
+        if dhash is None:
+            dhash = self.db.get_image_hash(note[0])
+        if dhash is None:
+            messagebox.showinfo("提示", "这张图片的特征还没有计算完成，请稍后再试")
+            return 'break'
+        matches = self.image_index.search(dhash)
+        distances = {note_id: distance for distance, note_id in matches}
+        notes = self.db.get_notes_meta([note_id for distance, note_id in matches])
+        display_values = [(n[0], f"{n[1]}（差异 {distances[n[0]]}）" if n[0] != note[0] else n[1],
+                           n[4], n[2], n[3]) for n in notes]
+        # 还没有返回的搜索结果不再覆盖相似图片的列表
+        self.searcher.cancel()
+        self._last_search = None
+        self.note_list.show_rows(notes, display_values)
+        if self.tree.exists(str(note[0])):
+            self.tree.selection_set(str(note[0]))
+            self.tree.focus(str(note[0]))
+            self.tree.see(str(note[0]))
+        return 'break'
+    
     def select_prev_note(self, event=None):
         current_selection = self.tree.selection()
         if not current_selection:
@@ -832,6 +1284,9 @@ class NoteApp:
 
         current_item = current_selection[0]
         prev_item = self.tree.prev(current_item)
+        # 已经到达已加载部分的开头时，加载上一页
+        if not prev_item and self.note_list.load_prev():
+            prev_item = self.tree.prev(current_item)
         if prev_item:
             self.tree.selection_set(prev_item)
             self.tree.focus(prev_item)
@@ -847,6 +1302,7 @@ class NoteApp:
         # 重置边框样式
         self.list_frame.configure(style='Normal.TFrame')
         self.preview_frame.configure(style='Normal.TFrame')
+        self.root.after_idle(self.hotkey_queue.mark_shown)
     
     def focus_preview(self, event=None):
         # 聚焦到预览区域
@@ -911,57 +1367,123 @@ class NoteApp:
             return
 
         if messagebox.askyesno("确认删除", "确定要删除选中的笔记吗？"):
+            note_ids = []
             for item in selected_items:
                 note_id = self.tree.item(item)['values'][0]
-                self.db.delete_note(note_id)
-            self.refresh_notes()
+                self.preview_cache.invalidate(note_id)
+                self.title_index.remove(note_id)
+                self.image_index.remove(note_id)
+                note_ids.append(note_id)
+            # 所有选中的笔记在后台写入线程中用一个事务删除，之后再分步释放空出的空间
+            self.writer.submit(lambda: self.db.delete_notes(note_ids),
+                               on_done=lambda deleted: self._reclaim_space(),
+                               on_error=self.on_delete_failed)
+            # 只移除被删除的行，不重建整个列表
+            self.note_list.remove_notes(note_ids)
+            self._invalidate_search_cache()
             # 清空预览区域
             self.preview_title.config(text="")
             self.preview_content.config(state="normal")
             self.preview_content.delete("1.0", tk.END)
             self.preview_content.config(state="disabled")
 
-    def _on_preview_resize(self, event):
-        # 只有当有图片显示时才重新调整大小
-        if hasattr(self, 'current_image_data') and self.current_image_data:
-            self.preview_content.config(state="normal")
-            self.preview_content.delete("1.0", tk.END)
-            
-            img = Image.open(io.BytesIO(self.current_image_data))
-            
-            # 获取新的预览区域大小
-            preview_width = self.preview_content.winfo_width()
-            preview_height = self.preview_content.winfo_height()
-            
-            img = self._resize_image(img, preview_width, preview_height)
-            self.current_image_photo = ImageTk.PhotoImage(img)
-            
-            self.preview_content.image_create("1.0", image=self.current_image_photo)
-            self.preview_content.insert("1.0", "\n\n")
-            self.preview_content.config(state="disabled")
-
-    def _resize_image(self, img, width, height):
-        if width <= 1 or height <= 1: # 避免除以零或负数
-            return img
+    def on_delete_failed(self, error):
+        messagebox.showerror("错误", f"删除笔记失败: {error}")
+        # 列表中已经移除了这些笔记，重新加载以显示实际的内容
+        self._invalidate_search_cache()
+        self.refresh_notes(self.search_var.get().strip() or None)
+    
+    def _reclaim_space(self, previous=None):
+        """每次在写入线程中释放一小部分空闲页，两步之间可以处理其他保存和删除"""
+        if self._reclaim_pending:
+            return
+        self._reclaim_pending = True
         
-        original_width, original_height = img.size
+        def on_done(remaining):
+            self._reclaim_pending = False
+            # 空闲页不再减少时停止，例如数据库还没有在空闲维护中转换为auto_vacuum=INCREMENTAL
+            if remaining and (previous is None or remaining < previous):
+                self.root.after(VACUUM_STEP_INTERVAL_MS, self._reclaim_space, remaining)
         
-        # 计算缩放比例
-        ratio_w = width / original_width
-        ratio_h = height / original_height
+        def on_error(error):
+            self._reclaim_pending = False
+        
+        self.writer.submit(self.db.incremental_vacuum, on_done=on_done, on_error=on_error)
+    
+    def _on_preview_resize(self, event):
+        # 只有当有图片显示时才重新调整大小
+        if getattr(self, 'current_image', None) is None:
+            return
+        # 获取新的预览区域大小
+        preview_width = self.preview_content.winfo_width()
+        preview_height = self.preview_content.winfo_height()
+        if (preview_width, preview_height) == self._preview_size:
+            return
+        self._preview_size = (preview_width, preview_height)
         
-        # 选择较小的比例以确保图片完全显示
-        ratio = min(ratio_w, ratio_h)
+        # 拖动过程中用已解码的图片快速缩放，不读取数据库也不重新解码
+        img = fit_image(self.current_image, preview_width, preview_height, fast=True)
+        self._display_photo(ImageTk.PhotoImage(img))
         
-        new_width = int(original_width * ratio)
-        new_height = int(original_height * ratio)
+        # 大小停止变化后再用LANCZOS高质量缩放一次
+        if self._resize_job is not None:
+            self.root.after_cancel(self._resize_job)
+        self._resize_job = self.root.after(RESIZE_DEBOUNCE_MS, self._finish_preview_resize)
+    
+    def _finish_preview_resize(self):
+        self._resize_job = None
+        if getattr(self, 'current_image', None) is not None:
+            preview_width, preview_height = self._preview_size
+            self._show_image_preview(self.current_note_id, preview_width, preview_height)
+
+    def _open_preview_stream(self, note_id, width, height):
+        """打开适合预览区大小的最小缩略图，没有时以流的方式打开原图"""
+        data = self.db.get_preview_image(note_id, width, height)
+        if data is not None:
+            return io.BytesIO(data)
+        return self.db.open_payload(note_id)
+    
+    def _get_preview_photo(self, note_id, width, height):
+        """返回 (解码后的图片, 缩放到预览区大小的PhotoImage)，优先从缓存中读取"""
+        cached = self.preview_cache.get(note_id, width, height)
+        if cached is not None:
+            return cached
+        stream = self._open_preview_stream(note_id, width, height)
+        if stream is None:
+            return None, None
+        # 直接从数据库流中解码图片，不在内存中保留压缩数据的副本
+        with stream:
+            image = Image.open(stream)
+            image.load()
+        # 调整图片大小以适应预览区域，并转换为PhotoImage以在Tkinter中显示
+        photo = ImageTk.PhotoImage(fit_image(image, width, height))
+        self.preview_cache.put(note_id, width, height, image, photo)
+        return image, photo
+    
+    def _show_image_preview(self, note_id, width, height):
+        image, photo = self._get_preview_photo(note_id, width, height)
+        if photo is None:
+            return False
+        self.current_image = image  # 存储解码后的预览图片
+        self._preview_size = (width, height)
+        self._display_photo(photo)
+        return True
+    
+    def _display_photo(self, photo):
+        self.current_image_photo = photo  # 存储PhotoImage引用
         
-        return img.resize((new_width, new_height), Image.LANCZOS)
+        # 在文本框中插入图片
+        self.preview_content.config(state="normal")
+        self.preview_content.delete("1.0", tk.END)
+        self.preview_content.image_create("1.0", image=self.current_image_photo)
+        self.preview_content.insert("1.0", "\n\n")  # 添加一些空行
+        self.preview_content.config(state="disabled")
 
     def on_select(self, event):
         selected_items = self.tree.selection()
         if not selected_items:
             # 清空预览区域
+            self.current_image = None
             self.preview_title.config(text="")
             self.preview_content.config(state="normal")
             self.preview_content.delete("1.0", tk.END)
@@ -971,6 +1493,18 @@ class NoteApp:
         item = selected_items[0]
         note_id = self.tree.item(item)['values'][0]
         self.current_note_id = note_id  # 存储当前笔记ID
+        
+        note = self.note_list.rows.get(item)
+        if note and note[4] == 'image':
+            # 图片笔记的标题来自列表，图片优先从预览缓存中读取
+            self.preview_title.config(text=note[1])
+            preview_width = self.preview_content.winfo_width()
+            preview_height = self.preview_content.winfo_height()
+            if self._show_image_preview(note_id, preview_width, preview_height):
+                # 绑定复制图片快捷键
+                self.preview_content.bind('<Control-c>', self.copy_image_to_clipboard)
+            return
+        
         title, content, note_type = self.db.get_note_content(note_id)
         
         if title and content:
@@ -978,87 +1512,51 @@ class NoteApp:
             self.preview_title.config(text=title)
             
             # 清空并更新预览内容
+            self.current_image = None
             self.preview_content.config(state="normal")
             self.preview_content.delete("1.0", tk.END)
             
-            if note_type == 'image':
-                # 从二进制数据创建图片
-                img = Image.open(io.BytesIO(content))
-                
-                # 调整图片大小以适应预览区域
-                preview_width = self.preview_content.winfo_width()
-                preview_height = self.preview_content.winfo_height()
-                # 调整图片大小以适应预览区域
-                img = self._resize_image(img, preview_width, preview_height)
-                
-                # 转换为PhotoImage以在Tkinter中显示
-                self.current_image_data = content # 存储原始图片数据
-                self.current_image_photo = ImageTk.PhotoImage(img) # 存储PhotoImage引用
-                
-                # 在文本框中插入图片
-                self.preview_content.image_create("1.0", image=self.current_image_photo)
-                self.preview_content.insert("1.0", "\n\n")  # 添加一些空行
-                self.preview_content.config(state="disabled")
-                
-                # 绑定复制图片快捷键
-                self.preview_content.bind('<Control-c>', self.copy_image_to_clipboard)
-            else:
-                # 文本类型直接显示并允许编辑
-                self.preview_content.insert("1.0", content)
-                self.preview_content.config(state="normal")
-                
-                # 绑定保存和复制快捷键
-                self.preview_content.bind('<Control-s>', self.save_text_content)
-                self.preview_content.bind('<Control-c>', self.copy_text_to_clipboard)
+            # 文本类型直接显示并允许编辑
+            self.preview_content.insert("1.0", content)
+            self.preview_content.config(state="normal")
+            
+            # 绑定保存和复制快捷键
+            self.preview_content.bind('<Control-s>', self.save_text_content)
+            self.preview_content.bind('<Control-c>', self.copy_text_to_clipboard)
 
     def copy_text_to_clipboard(self, event=None):
         try:
             # 获取选中的文本
             selected_text = self.preview_content.get(tk.SEL_FIRST, tk.SEL_LAST)
-            pyperclip.copy(selected_text)
+            self.clipboard.set_text(selected_text)
+            self.clipboard_watcher.ignore_current()
             messagebox.showinfo("提示", "文本已复制到剪贴板")
         except tk.TclError:  # 如果没有选中文本
             try:
                 # 复制全部文本
                 all_text = self.preview_content.get("1.0", tk.END).strip()
-                pyperclip.copy(all_text)
+                self.clipboard.set_text(all_text)
+                self.clipboard_watcher.ignore_current()
                 messagebox.showinfo("提示", "全部文本已复制到剪贴板")
             except:
                 messagebox.showerror("错误", "复制文本失败")
     
     def copy_image_to_clipboard(self, event=None):
-        if hasattr(self, 'current_image_data') and self.current_image_data:
-            # 将图片数据转换为PIL Image对象
-            img = Image.open(io.BytesIO(self.current_image_data))
+        if getattr(self, 'current_image', None) is not None:
+            # 预览显示的可能是缩略图，复制时从数据库流中解码原图
+            stream = self.db.open_payload(self.current_note_id)
+            if stream is None:
+                return
+            with stream:
+                img = Image.open(stream)
+                img.load()
             
             try:
-                # 将图片转换为BMP格式
-                output = io.BytesIO()
-                if img.mode == 'RGBA':
-                    # 如果图片有透明通道，先将其转换为RGB
-                    img = img.convert('RGB')
-                img.save(output, 'BMP')
-                data = output.getvalue()[14:]  # 跳过BMP文件头
-                output.close()
-                
-                # 确保剪贴板已关闭
-                try:
-                    win32clipboard.CloseClipboard()
-                except:
-                    pass
-                
-                # 打开剪贴板并写入数据
-                win32clipboard.OpenClipboard()
-                win32clipboard.EmptyClipboard()
-                win32clipboard.SetClipboardData(win32clipboard.CF_DIB, data)
+                self.clipboard.set_image(img)
+                self.clipboard_watcher.ignore_current()
             except Exception as e:
                 messagebox.showerror("错误", f"复制图片失败: {str(e)}")
                 return
-            finally:
-                try:
-                    win32clipboard.CloseClipboard()
-                except:
-                    pass
             
             messagebox.showinfo("提示", "图片已复制到剪贴板")
     
@@ -1069,17 +1567,38 @@ class NoteApp:
             # 获取当前笔记标题
             title = self.preview_title.cget("text")
             
-            # 更新数据库
-            self.db.update_note(self.current_note_id, title, content)
+            note_id = self.current_note_id
             
-            # 刷新笔记列表
-            self.refresh_notes()
+            def on_done(result):
+                # 把修改过的笔记移到列表顶部
+                self.on_note_saved(note_id)
+                messagebox.showinfo("提示", "笔记已保存")
             
-            messagebox.showinfo("提示", "笔记已保存")
+            # 在后台更新数据库
+            self.writer.submit(lambda: self.db.update_note(note_id, title, content),
+                               on_done=on_done, on_error=self.on_save_failed)
 
 def main():
+    # --startup-timing 或环境变量 FASTNOTE_STARTUP_TIMING 打开启动耗时报告
+    timer = StartupTimer(_STARTED, enabled='--startup-timing' in sys.argv
+                         or bool(os.environ.get('FASTNOTE_STARTUP_TIMING')))
+    timer.mark("导入模块")
+    # --trace 或环境变量 FASTNOTE_TRACE 打开性能跟踪
+    tracer = Tracer(enabled='--trace' in sys.argv or bool(os.environ.get('FASTNOTE_TRACE')))
+    # --live-capture 或环境变量 FASTNOTE_LIVE_CAPTURE 使用半透明遮罩，松开鼠标后再截图
+    freeze_capture = not ('--live-capture' in sys.argv or os.environ.get('FASTNOTE_LIVE_CAPTURE'))
+    # --clipboard-history 或环境变量 FASTNOTE_CLIPBOARD_HISTORY 启动时开始记录剪贴板历史
+    clipboard_history = '--clipboard-history' in sys.argv or bool(os.environ.get('FASTNOTE_CLIPBOARD_HISTORY'))
     root = tk.Tk()
-    app = NoteApp(root)   
+    # SQLite版本过低时直接提示，不打开主窗口
+    error = sqlite_version_error()
+    if error:
+        print(error)
+        root.withdraw()
+        messagebox.showerror("FastNote", error)
+        root.destroy()
+        return
+    app = NoteApp(root, timer, tracer, freeze_capture, clipboard_history)   
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,361 @@
+import io
+import os
+import sys
+
+# 与平台相关的截图、剪贴板和全局快捷键实现。
+# pywin32、pynput、pyperclip等模块在第一次使用时才导入，不拖慢启动，
+# 其他平台上也可以导入主程序的其余部分
+
+
+class ScreenFrame:
+    """整个虚拟屏幕的一帧截图，left/top是图片左上角在虚拟屏幕中的坐标"""
+
+    def __init__(self, image, left=0, top=0):
+        self.image = image
+        self.left = left
+        self.top = top
+
+    def crop(self, x1, y1, x2, y2):
+        """从内存中裁剪出虚拟屏幕坐标中的一块区域，返回新的图片，之后重复使用这一帧也不影响它"""
+        return self.image.crop((x1 - self.left, y1 - self.top, x2 - self.left, y2 - self.top))
+
+
+class CaptureBackend:
+    """屏幕截图"""
+
+    def grab(self, x1, y1, x2, y2):
+        """截取虚拟屏幕坐标中的一块区域，返回PIL图片"""
+        raise NotImplementedError
+
+    def grab_frame(self, reuse=None):
+        """截取整个虚拟屏幕，返回ScreenFrame
+
+        reuse是上一次返回的帧，屏幕大小没有变化时可以把新的画面写入它的图片，不再分配内存
+        """
+        width, height, left, top = self.virtual_screen()
+        return ScreenFrame(self.grab(left, top, left + width, top + height), left, top)
+
+    def virtual_screen(self):
+        """返回包含所有显示器的虚拟屏幕 (宽, 高, 左, 上)，无法获取时返回None"""
+        return None
+
+
+class ClipboardBackend:
+    """系统剪贴板"""
+
+    def get_text(self):
+        raise NotImplementedError
+
+    def set_text(self, text):
+        raise NotImplementedError
+
+    def set_image(self, img):
+        raise NotImplementedError
+
+    def get_image(self):
+        """返回剪贴板中的图片，没有图片时返回None"""
+        return None
+
+    def sequence_number(self):
+        """剪贴板内容每次变化时都会改变的编号，不读取内容就可以判断是否有变化，不支持时返回None"""
+        return None
+
+
+class HotkeyBackend:
+    """全局快捷键"""
+
+    def start(self, bindings):
+        """注册 {快捷键: 回调} 并在后台线程中监听，回调在监听线程中执行"""
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class PillowCaptureBackend(CaptureBackend):
+    def grab(self, x1, y1, x2, y2):
+        from PIL import ImageGrab
+        return ImageGrab.grab(bbox=(x1, y1, x2, y2), all_screens=True)
+
+    def grab_frame(self, reuse=None):
+        from PIL import ImageGrab
+        size = self.virtual_screen()
+        # 不指定区域时截取所有显示器，图片的左上角就是虚拟屏幕的左上角
+        image = ImageGrab.grab(all_screens=True)
+        return ScreenFrame(image, *(size[2:] if size else (0, 0)))
+
+
+class Win32CaptureBackend(PillowCaptureBackend):
+    """使用pywin32截图，支持多显示器，失败时回退到PIL的ImageGrab"""
+
+    def grab(self, x1, y1, x2, y2):
+        try:
+            import win32con
+            import win32gui
+            import win32ui
+            from PIL import Image
+            # 获取桌面窗口句柄
+            hwnd = win32gui.GetDesktopWindow()
+            # 获取设备上下文
+            hwndDC = win32gui.GetWindowDC(hwnd)
+            mfcDC = win32ui.CreateDCFromHandle(hwndDC)
+            saveDC = mfcDC.CreateCompatibleDC()
+
+            # 创建位图对象
+            saveBitMap = win32ui.CreateBitmap()
+            width = x2 - x1
+            height = y2 - y1
+            saveBitMap.CreateCompatibleBitmap(mfcDC, width, height)
+            saveDC.SelectObject(saveBitMap)
+
+            # 复制屏幕区域到位图
+            saveDC.BitBlt((0, 0), (width, height), mfcDC, (x1, y1), win32con.SRCCOPY)
+
+            # 将位图转换为PIL Image对象
+            bmpinfo = saveBitMap.GetInfo()
+            bmpstr = saveBitMap.GetBitmapBits(True)
+            img = Image.frombuffer(
+                'RGB',
+                (bmpinfo['bmWidth'], bmpinfo['bmHeight']),
+                bmpstr, 'raw', 'BGRX', 0, 1)
+
+            # 清理资源
+            saveDC.DeleteDC()
+            mfcDC.DeleteDC()
+            win32gui.ReleaseDC(hwnd, hwndDC)
+            win32gui.DeleteObject(saveBitMap.GetHandle())
+
+            return img
+        except Exception as e:
+            print(f"截图失败: {e}")
+            # 如果pywin32方法失败，回退到PIL的ImageGrab
+            return super().grab(x1, y1, x2, y2)
+
+    def virtual_screen(self):
+        try:
+            import win32api
+            # 使用EnumDisplayMonitors获取所有显示器信息
+            monitors = win32api.EnumDisplayMonitors(None, None)
+
+            # 初始化虚拟屏幕的边界
+            left = top = sys.maxsize
+            right = bottom = -sys.maxsize
+
+            # 遍历所有显示器，找出整个虚拟屏幕的边界
+            for monitor in monitors:
+                monitor_rect = win32api.GetMonitorInfo(monitor[0])['Monitor']
+                left = min(left, monitor_rect[0])
+                top = min(top, monitor_rect[1])
+                right = max(right, monitor_rect[2])
+                bottom = max(bottom, monitor_rect[3])
+
+            return (right - left, bottom - top, left, top)
+        except Exception as e:
+            print(f"获取虚拟屏幕尺寸失败: {e}")
+            return None
+
+    def grab_frame(self, reuse=None):
+        size = self.virtual_screen()
+        if size is None:
+            return super().grab_frame(reuse)
+        width, height, left, top = size
+        try:
+            import win32con
+            import win32gui
+            import win32ui
+            from PIL import Image
+            hwnd = win32gui.GetDesktopWindow()
+            hwndDC = win32gui.GetWindowDC(hwnd)
+            mfcDC = win32ui.CreateDCFromHandle(hwndDC)
+            saveDC = mfcDC.CreateCompatibleDC()
+            saveBitMap = win32ui.CreateBitmap()
+            try:
+                saveBitMap.CreateCompatibleBitmap(mfcDC, width, height)
+                saveDC.SelectObject(saveBitMap)
+                saveDC.BitBlt((0, 0), (width, height), mfcDC, (left, top), win32con.SRCCOPY)
+                bmpstr = saveBitMap.GetBitmapBits(True)
+            finally:
+                saveDC.DeleteDC()
+                mfcDC.DeleteDC()
+                win32gui.ReleaseDC(hwnd, hwndDC)
+                win32gui.DeleteObject(saveBitMap.GetHandle())
+        except Exception as e:
+            print(f"截图失败: {e}")
+            return super().grab_frame(reuse)
+        if reuse is not None and reuse.image.size == (width, height):
+            # 在原来的图片中就地解码，不再为整个屏幕分配新的内存
+            reuse.image.frombytes(bmpstr, 'raw', 'BGRX')
+            reuse.left, reuse.top = left, top
+            return reuse
+        return ScreenFrame(Image.frombuffer('RGB', (width, height), bmpstr, 'raw', 'BGRX', 0, 1),
+                           left, top)
+
+
+class SyntheticCaptureBackend(CaptureBackend):
+    """不访问屏幕，返回生成的画面，用于在没有显示器的环境中测试和基准测试截图流程
+
+    每次截图时把固定的背景写入复用的帧，再画一个位置随次数变化的方块，模拟屏幕内容的变化
+    """
+
+    def __init__(self, width=1920, height=1080, left=0, top=0):
+        from PIL import Image, ImageDraw
+        self.size = (width, height, left, top)
+        self.background = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        draw = ImageDraw.Draw(self.background)
+        for i in range(0, width, 160):
+            draw.rectangle((i, 40, i + 120, 80), fill=(40, 120 + i % 120, 200))
+            draw.text((i + 8, 50), f"window {i // 160}", fill=(255, 255, 255))
+        self.frames = 0
+
+    def virtual_screen(self):
+        return self.size
+
+    def grab(self, x1, y1, x2, y2):
+        return self.grab_frame().crop(x1, y1, x2, y2)
+
+    def grab_frame(self, reuse=None):
+        from PIL import Image, ImageDraw
+        width, height, left, top = self.size
+        if reuse is None or reuse.image.size != (width, height):
+            reuse = ScreenFrame(Image.new('RGB', (width, height)), left, top)
+        reuse.image.paste(self.background)
+        x = self.frames * 37 % max(width - 100, 1)
+        ImageDraw.Draw(reuse.image).rectangle((x, height // 2, x + 100, height // 2 + 60), fill=(220, 60, 60))
+        self.frames += 1
+        return reuse
+
+
+class MemoryClipboardBackend(ClipboardBackend):
+    """保存在内存中的剪贴板，用于在没有系统剪贴板的环境中测试"""
+
+    def __init__(self):
+        self.text = ""
+        self.image = None
+        self.sequence = 0
+
+    def get_text(self):
+        return self.text
+
+    def set_text(self, text):
+        self.text, self.image = text, None
+        self.sequence += 1
+
+    def get_image(self):
+        return self.image
+
+    def set_image(self, img):
+        self.text, self.image = "", img.copy()
+        self.sequence += 1
+
+    def sequence_number(self):
+        return self.sequence
+
+
+class PyperclipClipboardBackend(ClipboardBackend):
+    """通过pyperclip读写文本，不支持图片"""
+
+    def get_text(self):
+        import pyperclip
+        return pyperclip.paste()
+
+    def set_text(self, text):
+        import pyperclip
+        pyperclip.copy(text)
+
+    def set_image(self, img):
+        raise NotImplementedError("当前平台不支持复制图片")
+
+
+class Win32ClipboardBackend(PyperclipClipboardBackend):
+    def get_text(self):
+        import pyperclip
+        # 尝试使用 pyperclip 获取剪贴板内容
+        try:
+            return pyperclip.paste()
+        except pyperclip.PyperclipException:
+            pass
+        # 如果 pyperclip 失败，回退到 win32clipboard
+        import win32clipboard
+        try:
+            win32clipboard.OpenClipboard()
+            text = win32clipboard.GetClipboardData(win32clipboard.CF_TEXT)
+            if isinstance(text, bytes):
+                text = text.decode('gbk')
+            return text
+        except:
+            return ""
+        finally:
+            try:
+                win32clipboard.CloseClipboard()
+            except:
+                pass
+
+    def get_image(self):
+        from PIL import Image, ImageGrab
+        # 复制文件时返回的是文件名列表，只取图片
+        image = ImageGrab.grabclipboard()
+        return image if isinstance(image, Image.Image) else None
+
+    def sequence_number(self):
+        import win32clipboard
+        return win32clipboard.GetClipboardSequenceNumber()
+
+    def set_image(self, img):
+        import win32clipboard
+        # 将图片转换为BMP格式
+        output = io.BytesIO()
+        if img.mode == 'RGBA':
+            # 如果图片有透明通道，先将其转换为RGB
+            img = img.convert('RGB')
+        img.save(output, 'BMP')
+        data = output.getvalue()[14:]  # 跳过BMP文件头
+        output.close()
+
+        # 确保剪贴板已关闭
+        try:
+            win32clipboard.CloseClipboard()
+        except:
+            pass
+
+        try:
+            # 打开剪贴板并写入数据
+            win32clipboard.OpenClipboard()
+            win32clipboard.EmptyClipboard()
+            win32clipboard.SetClipboardData(win32clipboard.CF_DIB, data)
+        finally:
+            try:
+                win32clipboard.CloseClipboard()
+            except:
+                pass
+
+
+class PynputHotkeyBackend(HotkeyBackend):
+    def __init__(self):
+        self._listener = None
+
+    def start(self, bindings):
+        from pynput import keyboard
+        self._listener = keyboard.GlobalHotKeys(bindings)
+        self._listener.start()
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+def load_backends():
+    """返回当前平台的 (截图, 剪贴板, 快捷键) 实现
+
+    设置环境变量 FASTNOTE_CAPTURE=synthetic 时使用生成的画面代替真实截图，
+    FASTNOTE_CLIPBOARD=memory 时使用内存中的剪贴板
+    """
+    if sys.platform == 'win32':
+        capture, clipboard = Win32CaptureBackend(), Win32ClipboardBackend()
+    else:
+        capture, clipboard = PillowCaptureBackend(), PyperclipClipboardBackend()
+    if os.environ.get('FASTNOTE_CAPTURE') == 'synthetic':
+        capture = SyntheticCaptureBackend()
+    if os.environ.get('FASTNOTE_CLIPBOARD') == 'memory':
+        clipboard = MemoryClipboardBackend()
+    return capture, clipboard, PynputHotkeyBackend()
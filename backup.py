@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from db_operations import open_payload_stream, sqlite_version_error
+
+# 在线备份每一步复制的页数，每步之后暂停一下（秒），让其他连接可以写入
+BACKUP_PAGES = 256
+BACKUP_STEP_PAUSE = 0.002
+# 分步备份期间其他连接写入数据库会让备份从头开始，重新开始超过这个次数后改为一次复制完
+BACKUP_MAX_RESTARTS = 3
+# 默认的备份文件，相对于数据库所在的目录
+DEFAULT_BACKUP_FILE = os.path.join('backups', 'notes-backup.db')
+# 启动后第一次自动备份前的等待时间，以及之后的备份间隔（毫秒）
+BACKUP_FIRST_DELAY_MS = 2 * 60 * 1000
+BACKUP_INTERVAL_MS = 30 * 60 * 1000
+# 导出时每次读取的笔记数量
+EXPORT_PAGE_SIZE = 500
+# 导出笔记内容时复制的缓冲区大小
+EXPORT_COPY_BUFFER = 1024 * 1024
+# 导出文件中内容文件的扩展名
+EXPORT_EXTENSIONS = {'text/plain': '.txt', 'image/png': '.png'}
+
+
+def default_backup_path(db_file):
+    return os.path.join(os.path.dirname(os.path.abspath(db_file)), DEFAULT_BACKUP_FILE)
+
+
+def _connect(db_file):
+    # 备份和导出使用独立的连接，不影响DatabaseManager各线程的连接
+    return sqlite3.connect(db_file, timeout=10, isolation_level=None, check_same_thread=False)
+
+
+class _ZipWriter:
+    """导出为zip文件；图片已经压缩过，直接存储，文本用deflate压缩"""
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path, 'w', allowZip64=True)
+        # zip中同一时间只能写一个成员，笔记列表先写到临时文件，最后再放入zip
+        self.index = tempfile.TemporaryFile()
+
+    def open_member(self, name, mime_type):
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED if mime_type.startswith('image/') else zipfile.ZIP_DEFLATED
+        return self.zip.open(info, 'w', force_zip64=True)
+
+    def close(self):
+        self.index.seek(0)
+        with self.open_member('notes.jsonl', 'application/jsonl') as f:
+            shutil.copyfileobj(self.index, f)
+        self.index.close()
+        self.zip.close()
+
+
+class _DirectoryWriter:
+    """导出为目录：notes.jsonl 加 payloads/ 下按内容哈希命名的文件"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, 'payloads'), exist_ok=True)
+        self.index = open(os.path.join(path, 'notes.jsonl'), 'wb')
+
+    def open_member(self, name, mime_type):
+        return open(os.path.join(self.path, *name.split('/')), 'wb')
+
+    def close(self):
+        self.index.close()
+
+
+def export_notes(db_file, path, progress=None):
+    """把所有笔记导出为zip文件（路径以.zip结尾时）或目录，返回导出的笔记数量
+
+    notes.jsonl 每行是一条笔记的信息，file 字段指向 payloads/ 中的内容文件；
+    相同内容只保存一份。内容从数据库分块复制到输出文件，内存占用与笔记大小无关。
+    导出在一个读事务中完成，得到的是开始导出时刻的一致快照，WAL模式下不阻塞写入。
+    progress(已导出, 总数) 每导出一页调用一次
+    """
+    writer = _ZipWriter(path) if path.lower().endswith('.zip') else _DirectoryWriter(path)
+    conn = _connect(db_file)
+    exported = 0
+    try:
+        conn.execute('BEGIN')
+        total = conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+        written = set()
+        last_id = 0
+        while True:
+            rows = conn.execute('''
+                SELECT n.id, n.title, n.note_type, n.created_at, n.updated_at,
+                       n.payload_hash, n.payload_size, n.mime_type, n.width, n.height, p.rowid
+                FROM notes n
+                JOIN note_payloads p ON p.hash = n.payload_hash
+                WHERE n.id > ?
+                ORDER BY n.id
+                LIMIT ?
+            ''', (last_id, EXPORT_PAGE_SIZE)).fetchall()
+            if not rows:
+                break
+            for (note_id, title, note_type, created_at, updated_at,
+                 content_hash, size, mime_type, width, height, payload_rowid) in rows:
+                mime_type = mime_type or ('text/plain' if note_type == 'text' else 'image/png')
+                extension = EXPORT_EXTENSIONS.get(mime_type.split(';')[0], '')
+                name = f"payloads/{content_hash}{extension}"
+                if content_hash not in written:
+                    with open_payload_stream(conn, payload_rowid) as src, \
+                            writer.open_member(name, mime_type) as dst:
+                        shutil.copyfileobj(src, dst, EXPORT_COPY_BUFFER)
+                    written.add(content_hash)
+                record = {'id': note_id, 'title': title, 'type': note_type,
+                          'created_at': created_at, 'updated_at': updated_at,
+                          'mime_type': mime_type, 'size': size, 'sha256': content_hash,
+                          'file': name}
+                if width is not None:
+                    record['width'] = width
+                    record['height'] = height
+                writer.index.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            exported += len(rows)
+            last_id = rows[-1][0]
+            if progress:
+                progress(exported, max(total, exported))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+        writer.close()
+    return exported
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+class OnlineBackup:
+    """在程序运行期间把数据库备份到另一个文件
+
+    第一次使用SQLite的在线备份接口，每次复制BACKUP_PAGES页，先写到临时文件，完成后再替换，
+    中断时原来的备份保持完整。之后只同步有变化的部分：内容按哈希存放，备份中没有的内容才复制，
+    笔记只更新有变化的行，删除的笔记和不再使用的内容由触发器从备份中删除
+    """
+
+    def __init__(self, db_file, target, progress=None, pages=BACKUP_PAGES):
+        self.db_file = db_file
+        self.target = target
+        # progress(已复制页数, 总页数)，只在完整备份时调用
+        self.progress = progress
+        self.pages = pages
+
+    def run(self):
+        """返回 ('full' 或 'incremental', 复制的内容数量, 复制的内容字节数)"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.target)), exist_ok=True)
+        if self._can_sync():
+            return ('incremental',) + self._sync()
+        return ('full',) + self._full_backup()
+
+    def _can_sync(self):
+        if not os.path.exists(self.target):
+            return False
+        src = _connect(self.db_file)
+        dst = _connect(self.target)
+        try:
+            # 程序升级后数据库结构有变化时，重新完整备份
+            return (src.execute('PRAGMA user_version').fetchone()
+                    == dst.execute('PRAGMA user_version').fetchone())
+        except sqlite3.DatabaseError:
+            return False
+        finally:
+            src.close()
+            dst.close()
+
+    def _full_backup(self):
+        temp = self.target + '.tmp'
+        if os.path.exists(temp):
+            os.remove(temp)
+        src = _connect(self.db_file)
+        dst = _connect(temp)
+        self._remaining = None
+        self._restarts = 0
+        try:
+            try:
+                src.backup(dst, pages=self.pages, progress=self._on_step)
+            except _BackupRestarted:
+                # WAL模式下一次复制完只持有一个读事务，不阻塞写入
+                src.backup(dst)
+            # 备份文件不需要WAL，改回单个文件
+            dst.execute('PRAGMA journal_mode = DELETE')
+            # 内容的字节数记录在notes中，不需要再读一遍备份中的全部内容
+            count, size = dst.execute('''
+                SELECT COUNT(*), TOTAL(payload_size) FROM (SELECT DISTINCT payload_hash, payload_size FROM notes)
+            ''').fetchone()
+        finally:
+            src.close()
+            dst.close()
+        os.replace(temp, self.target)
+        return count, int(size)
+
+    def _on_step(self, status, remaining, total):
+        if self._remaining is not None and remaining > self._remaining:
+            self._restarts += 1
+            if self._restarts > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        self._remaining = remaining
+        if self.progress:
+            self.progress(total - remaining, total)
+        time.sleep(BACKUP_STEP_PAUSE)
+
+    def _sync(self):
+        conn = _connect(self.db_file)
+        try:
+            conn.execute('ATTACH DATABASE ? AS backup', (self.target,))
+            columns = [row[1] for row in conn.execute('PRAGMA main.table_info(notes)')]
+            column_list = ', '.join(columns)
+            assignments = ', '.join(f'{c} = m.{c}' for c in columns if c != 'id')
+            # 延迟开始的事务只在写入备份时锁定备份文件，对notes.db只读，
+            # 读到的是第一条语句执行时的快照，不阻塞主程序写入
+            conn.execute('BEGIN')
+            # 备份中的触发器会维护备份自己的引用计数、缩略图和全文索引
+            conn.execute('DELETE FROM backup.notes WHERE id NOT IN (SELECT id FROM main.notes)')
+            new_payloads = '''
+                FROM main.note_payloads
+                WHERE hash IN (SELECT payload_hash FROM main.notes)
+                  AND hash NOT IN (SELECT hash FROM backup.note_payloads)
+            '''
+            count, size = conn.execute(f'''
+                SELECT COUNT(*),
+                       TOTAL((SELECT payload_size FROM main.notes WHERE payload_hash = hash LIMIT 1))
+                {new_payloads}
+            ''').fetchone()
+            conn.execute(f'INSERT INTO backup.note_payloads (hash, data) SELECT hash, data {new_payloads}')
+            conn.execute('''
+                INSERT INTO backup.note_renditions (payload_hash, size, width, height, data)
+                SELECT payload_hash, size, width, height, data
+                FROM main.note_renditions r
+                WHERE NOT EXISTS (SELECT 1 FROM backup.note_renditions b
+                                  WHERE b.payload_hash = r.payload_hash AND b.size = r.size)
+                  AND EXISTS (SELECT 1 FROM backup.note_payloads p WHERE p.hash = r.payload_hash)
+            ''')
+            # 有变化的笔记原地更新，内容没变时不会删除再复制它的内容
+            conn.execute(f'''
+                UPDATE backup.notes AS b
+                SET {assignments}
+                FROM main.notes AS m
+                WHERE m.id = b.id
+                  AND b.id IN (SELECT id FROM (SELECT {column_list} FROM main.notes
+                                               EXCEPT SELECT {column_list} FROM backup.notes))
+            ''')
+            conn.execute(f'''
+                INSERT INTO backup.notes ({column_list})
+                SELECT {column_list} FROM main.notes
+                WHERE id NOT IN (SELECT id FROM backup.notes)
+            ''')
+            conn.execute('''
+                UPDATE backup.sqlite_sequence
+                SET seq = (SELECT seq FROM main.sqlite_sequence WHERE name = 'notes')
+                WHERE name = 'notes'
+            ''')
+            conn.execute('DELETE FROM backup.import_progress')
+            conn.execute('INSERT INTO backup.import_progress SELECT * FROM main.import_progress')
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return count, int(size)
+
+
+class BackupScheduler:
+    """用root.after定时在后台线程中运行OnlineBackup，状态通过dispatcher回到主线程
+
+    on_status(文字) 在主线程中调用，用于在状态栏显示备份进度和结果
+    """
+
+    def __init__(self, root, dispatcher, db_file, target=None, on_status=None,
+                 interval_ms=BACKUP_INTERVAL_MS, first_delay_ms=BACKUP_FIRST_DELAY_MS):
+        self.root = root
+        self.dispatcher = dispatcher
+        self.db_file = db_file
+        self.target = target or default_backup_path(db_file)
+        self.on_status = on_status
+        self.interval_ms = interval_ms
+        self.first_delay_ms = first_delay_ms
+        self._job = None
+        self._thread = None
+        self._percent = None
+
+    def start(self):
+        self._job = self.root.after(self.first_delay_ms, self._tick)
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        self._job = self.root.after(self.interval_ms, self._tick)
+        self.run_now()
+
+    def run_now(self):
+        """立即开始一次备份，上一次还没有完成时返回False"""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._percent = None
+        self._status("正在备份…")
+        self._thread = threading.Thread(target=self._run, name='FastNoteBackup', daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        try:
+            kind, count, size = OnlineBackup(self.db_file, self.target, self._on_progress).run()
+        except (sqlite3.Error, OSError) as e:
+            print(f"备份失败: {e}")
+            self.dispatcher.post(self._status, "备份失败")
+            return
+        self.dispatcher.post(self._status, f"已备份 {datetime.now().strftime('%H:%M')}")
+
+    def _on_progress(self, done, total):
+        # 百分比变化时才通知主线程
+        percent = done * 100 // total if total else 100
+        if percent != self._percent:
+            self._percent = percent
+            self.dispatcher.post(self._status, f"正在备份：{percent}%")
+
+    def _status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='导出笔记或备份数据库')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='导出为zip文件或目录（JSONL加内容文件）')
+    export_parser.add_argument('output', help='输出路径，以.zip结尾时导出为zip文件，否则导出到目录')
+    export_parser.add_argument('--db', default='notes.db', help='数据库文件')
+    backup_parser = subparsers.add_parser('backup', help='备份数据库，已有备份时只同步变化的部分')
+    backup_parser.add_argument('target', nargs='?', default=None, help=f'备份文件，默认为 {DEFAULT_BACKUP_FILE}')
+    backup_parser.add_argument('--db', default='notes.db', help='数据库文件')
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} 不存在')
+    if sqlite_version_error():
+        parser.error(sqlite_version_error())
+
+    started = time.perf_counter()
+    if args.command == 'export':
+        def progress(done, total):
+            print(f'\r{done}/{total}', end='', file=sys.stderr, flush=True)
+        count = export_notes(args.db, args.output, progress)
+        print(file=sys.stderr)
+        print(f'导出 {count} 条笔记到 {args.output}，用时 {time.perf_counter() - started:.1f}s',
+              file=sys.stderr)
+        return 0
+
+    target = args.target or default_backup_path(args.db)
+    kind, count, size = OnlineBackup(args.db, target).run()
+    label = '完整备份' if kind == 'full' else '增量备份'
+    print(f'{label}到 {target}，复制内容 {count} 个（{size / 1024 / 1024:.1f}MB），'
+          f'用时 {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
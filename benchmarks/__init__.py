@@ -0,0 +1,6 @@
+"""FastNote 性能基准测试
+
+只依赖数据库和图片处理模块，不需要Windows和图形界面：
+    python -m benchmarks.corpus bench.db --notes 100000
+    python -m benchmarks.run --notes 10000 --output results.json --baseline baseline.json
+"""
@@ -0,0 +1,128 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from PIL import Image, ImageDraw
+from db_operations import DatabaseManager, prepare_note
+from image_utils import encode_png
+
+# 生成的图片笔记所占的比例
+IMAGE_RATIO = 0.2
+# 截图的尺寸和各自所占的比例
+IMAGE_SIZES = (((320, 240), 0.3), ((1280, 720), 0.5), ((1920, 1080), 0.2))
+# 每种尺寸生成多少张不同的图片，其余的图片笔记重复使用它们
+IMAGE_POOL_SIZE = 8
+# 每个事务写入的笔记数量
+CORPUS_BATCH_SIZE = 1000
+# 文本内容的长度（字符数）和各自所占的比例
+TEXT_LENGTHS = (((20, 200), 0.6), ((1000, 4000), 0.35), ((20000, 100000), 0.05))
+
+WORDS = ('nginx', 'config', 'python', 'error', 'traceback', 'docker', 'redis', 'meeting',
+         'todo', 'release', 'deploy', 'kernel', 'cache', 'query', 'index', 'latency',
+         '截图', '会议', '记录', '服务器', '配置', '测试', '需求', '文档', '接口', '部署',
+         '数据库', '性能', '日志', '问题', '方案', '周报')
+# PIL默认字体只能绘制ASCII字符
+ASCII_WORDS = tuple(word for word in WORDS if word.isascii())
+
+
+def _choose(rng, weighted):
+    return rng.choices([value for value, weight in weighted],
+                       [weight for value, weight in weighted])[0]
+
+
+def random_title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+
+
+def random_text(rng, length=None):
+    if length is None:
+        low, high = _choose(rng, TEXT_LENGTHS)
+        length = rng.randint(low, high)
+    words = []
+    total = 0
+    while total < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        total += len(word) + 1
+    return ' '.join(words)[:length]
+
+
+def random_screenshot(rng, size):
+    """生成一张类似界面截图的PNG：纯色背景上的色块和文字行，压缩率与真实截图接近"""
+    width, height = size
+    img = Image.new('RGB', size, (rng.randint(220, 255),) * 3)
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(5, 30)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle([x, y, x + rng.randint(20, width // 2), y + rng.randint(10, height // 3)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    for y in range(10, height, 18):
+        line = ' '.join(rng.choice(ASCII_WORDS) for _ in range(rng.randint(2, 12)))
+        draw.text((rng.randint(5, 40), y), line, fill=(0, 0, 0))
+    return encode_png(img)
+
+
+def build_image_pool(rng, pool_size=IMAGE_POOL_SIZE):
+    """每种尺寸生成pool_size张不同的截图，返回 [(尺寸, [png数据, ...]), ...]"""
+    return [(size, [random_screenshot(rng, size) for _ in range(pool_size)])
+            for size, weight in IMAGE_SIZES]
+
+
+def generate_corpus(db_file, count, image_ratio=IMAGE_RATIO, pool_size=IMAGE_POOL_SIZE,
+                    seed=0, progress=None):
+    """在db_file中生成count条随机笔记，返回数据库
+
+    文本内容各不相同；图片从每种尺寸的图片池中选取，重复的图片按内容去重只存一份。
+    笔记的时间从2020年开始依次递增，按批通过add_notes写入
+    """
+    rng = random.Random(seed)
+    # 池中的图片只生成一次缩略图和感知哈希，之后只替换标题和时间
+    pool = {size: [prepare_note('', data, 'image') for data in images]
+            for size, images in build_image_pool(rng, pool_size)}
+    db = DatabaseManager(db_file)
+    started_at = datetime(2020, 1, 1)
+    batch = []
+    for index in range(count):
+        created_at = (started_at + timedelta(seconds=index * 37)).strftime('%Y-%m-%d %H:%M:%S')
+        if rng.random() < image_ratio:
+            size = _choose(rng, IMAGE_SIZES)
+            note = rng.choice(pool[size])._replace(title=random_title(rng), created_at=created_at)
+        else:
+            note = prepare_note(random_title(rng), random_text(rng), 'text', created_at)
+        batch.append(note)
+        if len(batch) >= CORPUS_BATCH_SIZE:
+            db.add_notes(batch)
+            batch = []
+        if progress and (index + 1) % 10000 == 0:
+            progress(index + 1, count)
+    db.add_notes(batch)
+    return db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成用于性能测试的笔记数据库')
+    parser.add_argument('db_file', help='生成的数据库文件（不能已经存在）')
+    parser.add_argument('--notes', type=int, default=10000, help='笔记数量')
+    parser.add_argument('--image-ratio', type=float, default=IMAGE_RATIO, help='图片笔记所占的比例')
+    parser.add_argument('--image-pool', type=int, default=IMAGE_POOL_SIZE,
+                        help='每种尺寸生成多少张不同的图片')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if os.path.exists(args.db_file):
+        parser.error(f'{args.db_file} 已经存在')
+
+    started = time.perf_counter()
+
+    def progress(done, total):
+        print(f'{done}/{total}  {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+    db = generate_corpus(args.db_file, args.notes, args.image_ratio, args.image_pool,
+                         args.seed, progress)
+    db.close()
+    print(f'生成了 {args.notes} 条笔记，用时 {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from PIL import Image
+from db_operations import DatabaseManager, prepare_note
+from image_utils import encode_png, fit_image
+from backends import SyntheticCaptureBackend
+from fuzzy_index import TitleIndex
+from benchmarks.corpus import generate_corpus, random_screenshot, random_text, random_title
+
+# 每个操作默认重复的次数
+DEFAULT_REPEAT = 50
+# 中位数比基准慢多少倍以上算作性能退化
+DEFAULT_TOLERANCE = 1.5
+# 变慢的绝对值小于这个时间（毫秒）时视为测量误差
+MIN_REGRESSION_MS = 0.05
+# 预览区的大小，与主窗口默认大小下的预览区接近
+PREVIEW_SIZE = (800, 600)
+# 截图测试使用的虚拟屏幕 (宽, 高, 左, 上)，相当于两台并排的1080p显示器，以及选中的区域
+SCREEN_SIZE = (3840, 1080, -1920, 0)
+CAPTURE_AREA = (-600, 200, 400, 900)
+
+
+def measure(func, repeat):
+    """重复调用func，返回每次的耗时（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        func()
+        samples.append((time.perf_counter_ns() - started) / 1e6)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min_ms': ordered[0],
+        'median_ms': statistics.median(ordered),
+        'p95_ms': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        'mean_ms': statistics.fmean(ordered),
+    }
+
+
+def decode_preview(db, note_id, width, height):
+    """与选中图片笔记时相同的路径：读取缩略图或原图的流，解码后缩放到预览区大小"""
+    data = db.get_preview_image(note_id, width, height)
+    stream = io.BytesIO(data) if data is not None else db.open_payload(note_id)
+    with stream:
+        image = Image.open(stream)
+        image.load()
+    return fit_image(image, width, height)
+
+
+def decode_original(db, note_id, width, height):
+    """没有缩略图时的路径：从原图解码再缩放"""
+    with db.open_payload(note_id) as stream:
+        image = Image.open(stream)
+        image.load()
+    return fit_image(image, width, height)
+
+
+def read_payload(db, note_id):
+    with db.open_payload(note_id) as stream:
+        while stream.read(64 * 1024):
+            pass
+
+
+def build_cases(db, rng):
+    """返回 [(名称, 函数, 重复次数倍率), ...]，参数在调用前随机选好，每次调用取下一个"""
+    notes = db.get_all_notes()
+    text_ids = [note[0] for note in notes if note[4] == 'text']
+    image_ids = [note[0] for note in notes if note[4] == 'image']
+    middle = notes[len(notes) // 2]
+
+    def cycle(values):
+        values = list(values)
+        rng.shuffle(values)
+        state = {'index': 0}
+
+        def next_value():
+            value = values[state['index'] % len(values)]
+            state['index'] += 1
+            return value
+        return next_value
+
+    next_note = cycle(note[0] for note in notes)
+    next_text = cycle(text_ids or [notes[0][0]])
+    next_image = cycle(image_ids or [notes[0][0]])
+    next_batch = cycle([[note[0] for note in rng.sample(notes, min(50, len(notes)))] for _ in range(8)])
+    added = []
+
+    def add_text():
+        added.append(db.add_note(random_title(rng), random_text(rng), 'text'))
+
+    # 数据库中没有的新截图，PNG编码在计时之外完成；用完之后再保存的是重复图片，走去重路径
+    new_images = [random_screenshot(rng, (1280, 720)) for _ in range(16)]
+    next_new_image = cycle(new_images)
+
+    def add_image():
+        added.append(db.add_note(random_title(rng), next_new_image(), 'image'))
+
+    def add_text_batch():
+        db.add_notes([prepare_note(random_title(rng), random_text(rng, 500)) for _ in range(100)])
+
+    def update_text():
+        note_id = next_text()
+        db.update_note(note_id, random_title(rng), random_text(rng, 500))
+
+    def delete_added():
+        if added:
+            db.delete_note(added.pop())
+
+    def delete_batch():
+        # 删除最新的100条，即add_notes.text_100写入的笔记
+        db.delete_notes([note[0] for note in db.iter_notes(limit=100)])
+
+    # 标题的模糊索引与主界面一样按加载顺序建立
+    title_index = TitleIndex()
+    title_index.build(db.get_all_notes())
+
+    capture = SyntheticCaptureBackend(*SCREEN_SIZE)
+    frame = capture.grab_frame()
+
+    def grab_frame():
+        capture.grab_frame(frame)
+
+    def crop_and_encode():
+        # 定格截图从选择结束到得到要保存的PNG：从内存中裁剪再编码
+        encode_png(frame.crop(*CAPTURE_AREA))
+
+    return [
+        ('add_note.text', add_text, 1),
+        ('add_note.image', add_image, 0.2),
+        ('add_notes.text_100', add_text_batch, 0.2),
+        ('update_note.text', update_text, 1),
+        ('delete_note', delete_added, 1),
+        ('delete_notes.text_100', delete_batch, 0.2),
+        ('get_all_notes', db.get_all_notes, 0.1),
+        ('iter_notes.first_page', lambda: db.iter_notes(), 1),
+        ('iter_notes.middle_page', lambda: db.iter_notes(after=(middle[3], middle[0])), 1),
+        ('iter_notes.image_page', lambda: db.iter_notes(note_type='image'), 1),
+        ('get_note_meta', lambda: db.get_note_meta(next_note()), 1),
+        ('get_notes_meta.50', lambda: db.get_notes_meta(next_batch()), 1),
+        ('get_note_info', lambda: db.get_note_info(next_note()), 1),
+        ('get_note_content.text', lambda: db.get_note_content(next_text()), 1),
+        ('get_note_content.image', lambda: db.get_note_content(next_image()), 1),
+        ('open_payload.read_image', lambda: read_payload(db, next_image()), 1),
+        ('get_preview_image', lambda: db.get_preview_image(next_image(), *PREVIEW_SIZE), 1),
+        ('get_image_hash', lambda: db.get_image_hash(next_image()), 1),
+        ('get_image_hashes', db.get_image_hashes, 0.1),
+        ('search_notes.trigram', lambda: db.search_notes('nginx config'), 1),
+        ('search_notes.cjk', lambda: db.search_notes('服务器'), 1),
+        ('search_notes.short_term', lambda: db.search_notes('会议'), 0.2),
+        ('search_notes.no_match', lambda: db.search_notes('zzzqqq'), 1),
+        ('search_notes_by_title', lambda: db.search_notes_by_title('deploy'), 1),
+        ('title_index.typo', lambda: title_index.search('ngnix cnofig'), 1),
+        ('title_index.cjk_typo', lambda: title_index.search('服务器配制'), 1),
+        ('title_index.abbreviation', lambda: title_index.search('ngxcf'), 1),
+        ('preview.decode_rendition', lambda: decode_preview(db, next_image(), *PREVIEW_SIZE), 0.2),
+        ('preview.decode_original', lambda: decode_original(db, next_image(), *PREVIEW_SIZE), 0.2),
+        ('capture.grab_frame', grab_frame, 0.2),
+        ('capture.crop_selection', lambda: frame.crop(*CAPTURE_AREA), 1),
+        ('capture.crop_and_encode', crop_and_encode, 0.2),
+    ]
+
+
+def run_benchmarks(db_file, repeat=DEFAULT_REPEAT, seed=0, only=None):
+    """对db_file中的数据库运行所有基准测试，返回 {名称: 统计结果}"""
+    rng = random.Random(seed)
+    db = DatabaseManager(db_file)
+    results = {}
+    try:
+        for name, func, weight in build_cases(db, rng):
+            if only and not any(pattern in name for pattern in only):
+                continue
+            runs = max(int(repeat * weight), 3)
+            # 先运行一次，排除首次编译语句和冷缓存的影响
+            func()
+            results[name] = summarize(measure(func, runs))
+    finally:
+        db.close()
+    return results
+
+
+def environment(db_file):
+    with sqlite3.connect(db_file) as conn:
+        notes = conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+    return {
+        'notes': notes,
+        'db_bytes': os.path.getsize(db_file),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """与基准结果比较中位数，返回 [(名称, 基准ms, 当前ms, 倍数), ...] 中变慢超过tolerance的项"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or base['median_ms'] <= 0:
+            continue
+        ratio = result['median_ms'] / base['median_ms']
+        if ratio > tolerance and result['median_ms'] - base['median_ms'] > MIN_REGRESSION_MS:
+            regressions.append((name, base['median_ms'], result['median_ms'], ratio))
+    return regressions
+
+
+def format_table(results, baseline=None):
+    lines = [f"{'操作':<28}{'中位数ms':>12}{'p95 ms':>12}{'基准ms':>12}{'倍数':>8}"]
+    for name, result in results.items():
+        base = (baseline or {}).get(name)
+        base_text = f"{base['median_ms']:12.3f}" if base else f"{'-':>12}"
+        ratio_text = f"{result['median_ms'] / base['median_ms']:8.2f}" if base and base['median_ms'] else f"{'-':>8}"
+        lines.append(f"{name:<28}{result['median_ms']:12.3f}{result['p95_ms']:12.3f}{base_text}{ratio_text}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='FastNote 数据库和预览的性能基准测试')
+    parser.add_argument('--db', help='使用已有的数据库（会被修改，请使用副本）；不指定时生成临时数据库')
+    parser.add_argument('--notes', type=int, default=10000, help='生成的临时数据库中的笔记数量')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='每个操作重复的次数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', action='append', help='只运行名称中包含该字符串的测试，可以指定多次')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    parser.add_argument('--baseline', help='与之比较的基准结果JSON文件')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='中位数超过基准多少倍时视为退化')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_file = args.db
+        if db_file is None:
+            db_file = os.path.join(temp_dir, 'bench.db')
+            print(f'正在生成 {args.notes} 条笔记...', file=sys.stderr)
+            generate_corpus(db_file, args.notes, seed=args.seed).close()
+        results = run_benchmarks(db_file, args.repeat, args.seed, args.only)
+        report = {'environment': environment(db_file), 'results': results}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print(format_table(results, baseline), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, base, current, ratio in regressions:
+            print(f'性能退化: {name} {base:.3f}ms -> {current:.3f}ms ({ratio:.2f}x)', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import argparse
+import collections
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from db_operations import DatabaseManager, prepare_note, sqlite_version_error
+from image_utils import encode_png
+
+# 可以导入的文件类型
+TEXT_EXTENSIONS = ('.txt', '.md')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+# 每个事务写入的笔记数量和内容的总字节数上限，先达到哪个就提交
+IMPORT_BATCH_SIZE = 200
+IMPORT_BATCH_BYTES = 64 * 1024 * 1024
+# 每个工作进程一次领取的文件数量
+IMPORT_CHUNK_SIZE = 8
+# 每个工作进程最多同时排队的任务数，限制已处理但还没写入的数据占用的内存
+IMPORT_QUEUE_PER_WORKER = 4
+
+
+def scan_files(root):
+    """返回目录中所有可以导入的文件 [(路径, 大小, 修改时间), ...]，按路径排序"""
+    files = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS + IMAGE_EXTENSIONS:
+                path = os.path.abspath(os.path.join(directory, filename))
+                stat = os.stat(path)
+                files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+
+def read_text(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    for encoding in ('utf-8-sig', 'gbk'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return data.decode('utf-8', errors='replace')
+
+
+def prepare_file(file_info, root):
+    """在工作进程中读取一个文件并准备好笔记数据，返回 (file_info, PreparedNote或None, 错误信息)
+
+    图片统一解码后重新编码为PNG，与截图保存的格式一致；标题是相对于导入目录的路径
+    """
+    path, size, mtime = file_info
+    title = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, '/')
+    created_at = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        if os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS:
+            return file_info, prepare_note(title, read_text(path), 'text', created_at), None
+        from PIL import Image
+        with Image.open(path) as img:
+            img.load()
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            content = encode_png(img)
+        return file_info, prepare_note(title, content, 'image', created_at), None
+    except Exception as e:
+        return file_info, None, str(e)
+
+
+def _prepare_chunk(root, chunk):
+    return [prepare_file(file_info, root) for file_info in chunk]
+
+
+class BulkImporter:
+    """把一个目录中的文本文件和图片批量导入为笔记
+
+    文件的读取、图片的重新编码、缩略图和感知哈希在进程池中并行完成，
+    主进程按批在一个事务中写入数据库，已写入的文件同时记入import_progress。
+    中断后用相同的目录重新导入，未修改过的已导入文件会被跳过
+    """
+
+    def __init__(self, db, root, workers=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.db = db
+        self.root = os.path.abspath(root)
+        self.workers = workers
+        self.batch_size = batch_size
+        # progress(已处理, 总数, 失败数) 每提交一批调用一次
+        self.progress = progress
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def pending_files(self):
+        """返回还没有导入、或导入后被修改过的文件"""
+        done = self.db.get_imported_files()
+        files = scan_files(self.root)
+        pending = [info for info in files if done.get(info[0]) != (info[1], info[2])]
+        self.skipped = len(files) - len(pending)
+        return pending
+
+    def run(self):
+        files = self.pending_files()
+        total = len(files)
+        chunks = iter([files[i:i + IMPORT_CHUNK_SIZE] for i in range(0, total, IMPORT_CHUNK_SIZE)])
+        workers = self.workers or os.cpu_count() or 1
+        batch = []
+        batch_files = []
+        batch_bytes = 0
+        processed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # 按顺序取回结果，取走一个再提交一个，同时排队的任务数量固定
+            in_flight = collections.deque()
+
+            def submit_next():
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    in_flight.append(pool.submit(_prepare_chunk, self.root, chunk))
+
+            for _ in range(workers * IMPORT_QUEUE_PER_WORKER):
+                submit_next()
+            while in_flight:
+                results = in_flight.popleft().result()
+                submit_next()
+                for file_info, note, error in results:
+                    processed += 1
+                    if note is None:
+                        self.errors.append((file_info[0], error))
+                        continue
+                    batch.append(note)
+                    batch_files.append(file_info)
+                    batch_bytes += note.payload_size
+                    if len(batch) >= self.batch_size or batch_bytes >= IMPORT_BATCH_BYTES:
+                        self._flush(batch, batch_files, processed, total)
+                        batch, batch_files, batch_bytes = [], [], 0
+            self._flush(batch, batch_files, processed, total)
+        return self.imported
+
+    def _flush(self, batch, batch_files, processed, total):
+        if batch:
+            self.imported += len(self.db.add_notes(batch, batch_files))
+        if self.progress:
+            self.progress(processed, total, len(self.errors))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='把目录中的文本文件（.txt/.md）和图片批量导入为笔记')
+    parser.add_argument('folder', help='要导入的目录')
+    parser.add_argument('--db', default='notes.db', help='数据库文件')
+    parser.add_argument('--workers', type=int, default=None, help='处理图片的进程数，默认为CPU核数')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='每个事务写入的笔记数量')
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.folder):
+        parser.error(f'{args.folder} 不是目录')
+    if sqlite_version_error():
+        parser.error(sqlite_version_error())
+
+    started = time.perf_counter()
+
+    def progress(done, total, failed):
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0
+        print(f'\r{done}/{total}  失败 {failed}  {rate:.0f} 个/秒', end='', file=sys.stderr, flush=True)
+
+    db = DatabaseManager(args.db)
+    importer = BulkImporter(db, args.folder, args.workers, args.batch_size, progress)
+    try:
+        importer.run()
+    finally:
+        db.close()
+    print(file=sys.stderr)
+    for path, error in importer.errors:
+        print(f'导入失败: {path}: {error}', file=sys.stderr)
+    print(f'导入 {importer.imported} 个文件，跳过已导入的 {importer.skipped} 个，'
+          f'失败 {len(importer.errors)} 个，用时 {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    return 1 if importer.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import collections
+import hashlib
+import threading
+import time
+from datetime import datetime
+from db_operations import payload_hash, prepare_note
+from image_utils import encode_png
+
+# 检查剪贴板编号的间隔（秒），只读取一个整数，空闲时几乎不占用CPU
+CLIPBOARD_POLL_INTERVAL = 0.5
+# 攒够这么多条，或者最早的一条等待超过这个时间（秒）后一起写入数据库
+CLIPBOARD_BATCH_SIZE = 20
+CLIPBOARD_FLUSH_INTERVAL = 5
+# 记住最近多少个内容的哈希，重复复制同样的内容时跳过
+CLIPBOARD_RECENT_HASHES = 1000
+# 超过这个长度的文本不记录（字符数）
+CLIPBOARD_MAX_TEXT = 1024 * 1024
+# 标题中显示的文本长度
+CLIPBOARD_TITLE_LENGTH = 40
+
+
+class ClipboardWatcher:
+    """在后台记录剪贴板中的文本和图片，保存为笔记
+
+    只在剪贴板的编号（sequence_number）变化时才读取内容；内容按哈希去重，
+    最近出现过或者已经有笔记使用的内容不再保存。新的内容先攒成一批，
+    再通过写入队列用一个事务写入。剪贴板不支持编号时不启动
+    """
+
+    def __init__(self, clipboard, db, writer, on_saved=None, on_error=None,
+                 interval=CLIPBOARD_POLL_INTERVAL, batch_size=CLIPBOARD_BATCH_SIZE,
+                 flush_interval=CLIPBOARD_FLUSH_INTERVAL):
+        self.clipboard = clipboard
+        self.db = db
+        self.writer = writer
+        # on_saved(note_ids) 和 on_error(exception) 由写入队列在主线程中调用
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self.interval = interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.skipped = 0
+        self._recent = collections.OrderedDict()
+        self._pending = []
+        self._pending_since = None
+        self._last_sequence = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """开始记录，剪贴板不支持变化编号时返回False"""
+        if self.running:
+            return True
+        sequence = self.clipboard.sequence_number()
+        if sequence is None:
+            return False
+        # 启动前已经在剪贴板中的内容不记录
+        self._last_sequence = sequence
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='FastNoteClipboard', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """停止记录，已经读取但还没有写入的内容立即提交写入"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def ignore_current(self):
+        """程序自己写入剪贴板后调用，这次变化不记录"""
+        with self._lock:
+            self._last_sequence = self.clipboard.sequence_number()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"读取剪贴板失败: {e}")
+
+    def poll(self):
+        """检查一次剪贴板，有新内容时读取；返回是否读取了内容"""
+        sequence = self.clipboard.sequence_number()
+        with self._lock:
+            changed = sequence != self._last_sequence
+            self._last_sequence = sequence
+        if changed:
+            self._capture()
+        if self._pending_since is not None and time.monotonic() - self._pending_since >= self.flush_interval:
+            self.flush()
+        return changed
+
+    def _capture(self):
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        image = self.clipboard.get_image()
+        if image is not None:
+            # 先用像素计算哈希，重复的图片不需要编码为PNG
+            key = hashlib.sha256(repr((image.mode, image.size)).encode() + image.tobytes()).hexdigest()
+            if self._seen(key):
+                return
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGB')
+            content = encode_png(image)
+            content_hash = payload_hash(content)
+            title = f"剪贴板图片 {image.width}x{image.height}"
+            note_type = 'image'
+        else:
+            content = self.clipboard.get_text()
+            if not content or not content.strip() or len(content) > CLIPBOARD_MAX_TEXT:
+                return
+            content_hash = payload_hash(content)
+            if self._seen(content_hash):
+                return
+            title = "剪贴板: " + " ".join(content.split())[:CLIPBOARD_TITLE_LENGTH]
+            note_type = 'text'
+        # 已经有笔记使用同样的内容时不再保存，先查重再生成缩略图和感知哈希
+        if self.db.has_payload(content_hash):
+            self.skipped += 1
+            return
+        note = prepare_note(title, content, note_type, created_at, content_hash)
+        self._pending.append(note)
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _seen(self, key):
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            self.skipped += 1
+            return True
+        self._recent[key] = True
+        if len(self._recent) > CLIPBOARD_RECENT_HASHES:
+            self._recent.popitem(last=False)
+        return False
+
+    def flush(self):
+        """把攒下的内容交给写入队列，在一个事务中写入"""
+        batch, self._pending, self._pending_since = self._pending, [], None
+        if not batch:
+            return
+        self.recorded += len(batch)
+        self.writer.submit(lambda: self.db.add_notes(batch), on_done=self.on_saved, on_error=self.on_error)
@@ -1,9 +1,192 @@
+import hashlib
+import io
+import os
 import sqlite3
+import threading
+from collections import namedtuple
 from datetime import datetime
+from image_utils import (build_renditions, image_dhash, image_info, RENDITION_MIN_REDUCTION,
+                         RENDITION_SIZES, TEXT_MIME_TYPE)
+
+# 需要的最低SQLite版本：全文索引的trigram分词器需要3.34，备份同步用到的 UPDATE ... FROM 需要3.33
+MIN_SQLITE_VERSION = (3, 34, 0)
+
+# 连接参数：内存映射读取的上限和每个连接的页缓存大小
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 16 * 1024
+# 每个连接缓存的预编译语句数量
+CACHED_STATEMENTS = 256
+
+# 流式读取内容时的缓冲区大小
+PAYLOAD_BUFFER_SIZE = 64 * 1024
+
+# 笔记列表分页加载时每页的条数
+PAGE_SIZE = 100
+# 感知哈希以有符号整数存储，读出时还原为64位无符号整数
+DHASH_MASK = (1 << 64) - 1
+# 每次incremental_vacuum释放的空闲页数量
+VACUUM_STEP_PAGES = 256
+# ANALYZE每个索引最多读取的行数，统计信息够用即可，不需要扫描整张表
+ANALYSIS_LIMIT = 1000
+# 维护时更新统计信息和检查结构的表
+MAINTAINED_TABLES = ('notes', 'note_payloads', 'note_renditions', 'import_progress')
+
+# 搜索结果的最大条数
+SEARCH_LIMIT = 500
+# 搜索结果中只取文本内容开头的这么多字，用于生成摘要和在结果中继续筛选
+SEARCH_EXCERPT_CHARS = 2000
+# 搜索结果排序：标题中匹配的权重，以及与BM25相同的词频饱和参数和长度归一化参数
+SEARCH_TITLE_WEIGHT = 10.0
+SEARCH_RANK_K1 = 1.2
+SEARCH_RANK_B = 0.75
+# 搜索结果中高亮匹配文字使用的标记
+HIGHLIGHT_OPEN = '【'
+HIGHLIGHT_CLOSE = '】'
+
+# 全文索引中文本笔记的内容，图片笔记只索引标题
+FTS_BODY_SQL = '''CASE WHEN new.note_type = 'text'
+                    THEN (SELECT CAST(data AS TEXT) FROM note_payloads WHERE hash = new.payload_hash)
+                    ELSE '' END'''
+
+
+def sqlite_version_error():
+    """Python自带的SQLite版本过低时返回说明文字，否则返回None"""
+    if sqlite3.sqlite_version_info >= MIN_SQLITE_VERSION:
+        return None
+    required = '.'.join(map(str, MIN_SQLITE_VERSION))
+    return (f"SQLite版本过低：当前为 {sqlite3.sqlite_version}，至少需要 {required}"
+            f"（全文搜索使用trigram分词器）。请安装较新的Python（3.9 或更高版本）")
+
+
+def payload_metadata(content, note_type):
+    """返回内容的 (字节数, mime类型, 宽, 高)，文本笔记没有宽高"""
+    if isinstance(content, str):
+        return len(content.encode('utf-8')), TEXT_MIME_TYPE, None, None
+    if note_type == 'image':
+        mime_type, width, height = image_info(content)
+        return len(content), mime_type, width, height
+    return len(content), 'application/octet-stream', None, None
+
+
+def stored_dhash(data):
+    """计算图片数据的感知哈希并转换为有符号64位整数（SQLite的整数范围），失败时返回None"""
+    try:
+        value = image_dhash(data)
+    except Exception as e:
+        print(f"计算图片哈希失败: {e}")
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+# 写入一条笔记所需的全部数据，由prepare_note计算，可以在其他进程中准备好再批量写入
+PreparedNote = namedtuple('PreparedNote', (
+    'title', 'content', 'note_type', 'created_at', 'content_hash',
+    'payload_size', 'mime_type', 'width', 'height', 'renditions', 'dhash'))
+
+
+def prepare_note(title, content, note_type='text', created_at=None, content_hash=None):
+    """计算内容哈希、元数据，图片还生成缩略图和感知哈希
+
+    不访问数据库，耗时的图片处理可以放在进程池中并行执行，结果交给add_notes批量写入；
+    调用方已经算过payload_hash(content)时可以通过content_hash传入
+    """
+    if created_at is None:
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    renditions = []
+    dhash = None
+    if note_type == 'image':
+        try:
+            renditions = build_renditions(content)
+        except Exception as e:
+            print(f"生成缩略图失败: {e}")
+        dhash = stored_dhash(min(renditions)[3] if renditions else content)
+    if content_hash is None:
+        content_hash = payload_hash(content)
+    return PreparedNote(title, content, note_type, created_at, content_hash,
+                        *payload_metadata(content, note_type), renditions, dhash)
+
+
+def payload_hash(content):
+    """笔记内容的SHA-256，文本按UTF-8编码计算"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+class PayloadStream(io.RawIOBase):
+    """note_payloads中一条内容的只读流
+
+    基于sqlite3的增量BLOB读取，按需从数据库读出数据，不会把整个内容复制到内存。
+    流持有数据库的读事务，应在打开它的线程中使用并尽快关闭
+    """
+
+    def __init__(self, blob):
+        self._blob = blob
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._blob.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self):
+        return self._blob.tell()
+
+    def __len__(self):
+        return len(self._blob)
+
+    def close(self):
+        if not self.closed:
+            self._blob.close()
+        super().close()
+
+
+def open_payload_stream(conn, payload_rowid):
+    """以只读文件对象的形式打开note_payloads中的一条内容，备份导出时也使用"""
+    if not hasattr(conn, 'blobopen'):
+        # Python 3.11 之前没有增量BLOB接口，只能整体读出
+        data = conn.execute('SELECT data FROM note_payloads WHERE rowid = ?', (payload_rowid,)).fetchone()[0]
+        return io.BytesIO(data.encode('utf-8') if isinstance(data, str) else data)
+    blob = conn.blobopen('note_payloads', 'data', payload_rowid, readonly=True)
+    return io.BufferedReader(PayloadStream(blob), PAYLOAD_BUFFER_SIZE)
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_file = 'notes.db'
+    # 数据库迁移，按顺序执行，PRAGMA user_version 记录已经执行到第几个
+    MIGRATIONS = (
+        '_migrate_fts_index',
+        '_migrate_list_indexes',
+        '_migrate_renditions',
+        '_migrate_payload_store',
+        '_migrate_payload_metadata',
+        '_migrate_image_hashes',
+        '_migrate_import_progress',
+        '_migrate_incremental_vacuum',
+    )
+    # 耗时较长的迁移（例如VACUUM整个数据库），启动时不执行，由空闲维护在后台线程中执行
+    DEFERRED_MIGRATIONS = frozenset((
+        '_migrate_incremental_vacuum',
+    ))
+
+    def __init__(self, db_file='notes.db'):
+        # 在建表和迁移之前检查，避免迁移到一半时才因为不支持的语法失败
+        error = sqlite_version_error()
+        if error:
+            raise RuntimeError(error)
+        self.db_file = db_file
+        # 每个线程复用一个长连接，避免每次操作都重新打开数据库、解析表结构
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_db()
     
     def init_db(self):
@@ -21,19 +204,513 @@ class DatabaseManager:
                 )
             ''')
             conn.commit()
+            self.migrate(conn)
+    
+    def migrate(self, conn, deferred=False):
+        """执行尚未应用的数据库迁移
+
+        启动时遇到DEFERRED_MIGRATIONS中的迁移就停下，它和之后的迁移等空闲维护
+        以deferred=True调用时再执行；每个迁移成功后才更新user_version
+        """
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for index in range(version, len(self.MIGRATIONS)):
+            name = self.MIGRATIONS[index]
+            if name in self.DEFERRED_MIGRATIONS and not deferred:
+                break
+            getattr(self, name)(conn)
+            conn.execute(f'PRAGMA user_version = {index + 1}')
+            conn.commit()
+    
+    def has_pending_migrations(self):
+        """是否还有推迟到空闲维护时执行的迁移"""
+        version = self.get_connection().execute('PRAGMA user_version').fetchone()[0]
+        return version < len(self.MIGRATIONS)
+    
+    def _migrate_fts_index(self, conn):
+        # 标题和文本内容的全文索引，trigram分词支持中文和任意子串匹配
+        # 时间和类型也存一份，搜索时不需要回表读取带图片的notes行
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                title, body,
+                note_type UNINDEXED, created_at UNINDEXED, updated_at UNINDEXED,
+                tokenize = 'trigram'
+            )
+        ''')
+        # 通过触发器保持全文索引与notes表同步，图片笔记只索引标题
+        conn.executescript('''
+            CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, title, body, note_type, created_at, updated_at)
+                VALUES (new.id, new.title,
+                        CASE WHEN new.note_type = 'text' THEN CAST(new.content AS TEXT) ELSE '' END,
+                        new.note_type, new.created_at, new.updated_at);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+                DELETE FROM notes_fts WHERE rowid = old.id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
+                UPDATE notes_fts
+                SET title = new.title,
+                    body = CASE WHEN new.note_type = 'text' THEN CAST(new.content AS TEXT) ELSE '' END,
+                    note_type = new.note_type,
+                    created_at = new.created_at,
+                    updated_at = new.updated_at
+                WHERE rowid = new.id;
+            END;
+        ''')
+        # 为已有的笔记建立索引
+        conn.execute('''
+            INSERT INTO notes_fts (rowid, title, body, note_type, created_at, updated_at)
+            SELECT id, title,
+                   CASE WHEN note_type = 'text' THEN CAST(content AS TEXT) ELSE '' END,
+                   note_type, created_at, updated_at
+            FROM notes
+        ''')
+    
+    def _migrate_list_indexes(self, conn):
+        # 笔记列表按更新时间分页，按类型筛选时同样走索引
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_updated ON notes (updated_at, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_type ON notes (note_type, updated_at, id)')
+    
+    def _migrate_renditions(self, conn):
+        # 图片笔记的多级缩略图，预览时不必解码和缩放原图
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS note_renditions (
+                note_id INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (note_id, size)
+            )
+        ''')
+        # 笔记删除或图片内容改变时，缩略图随之失效；已有的图片由后台补齐
+        conn.executescript('''
+            CREATE TRIGGER IF NOT EXISTS note_renditions_delete AFTER DELETE ON notes BEGIN
+                DELETE FROM note_renditions WHERE note_id = old.id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS note_renditions_update AFTER UPDATE OF content ON notes BEGIN
+                DELETE FROM note_renditions WHERE note_id = new.id;
+            END;
+        ''')
+    
+    def _migrate_payload_store(self, conn):
+        # 笔记内容按SHA-256去重存放在note_payloads中，notes只保存内容的哈希，
+        # 相同的截图或文本保存多次只占用一份空间；缩略图也按内容哈希存放
+        conn.execute('BEGIN')
+        conn.execute('''
+            CREATE TABLE note_payloads (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('CREATE TEMP TABLE note_hashes (id INTEGER PRIMARY KEY, hash TEXT NOT NULL)')
+        # 逐行计算哈希并去重，同一时间只有一条笔记的内容在内存中
+        rows = conn.execute('SELECT id, content FROM notes')
+        for note_id, content in rows:
+            content_hash = payload_hash(content)
+            conn.execute('INSERT OR IGNORE INTO note_payloads (hash, data) VALUES (?, ?)',
+                         (content_hash, content))
+            conn.execute('INSERT INTO note_hashes (id, hash) VALUES (?, ?)', (note_id, content_hash))
+        
+        # 重建notes表，去掉content列
+        sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'notes'").fetchone()
+        for trigger in ('notes_fts_insert', 'notes_fts_delete', 'notes_fts_update',
+                        'note_renditions_delete', 'note_renditions_update'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute('''
+            CREATE TABLE notes_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                payload_hash TEXT NOT NULL,
+                note_type TEXT DEFAULT 'text',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO notes_new (id, title, payload_hash, note_type, created_at, updated_at)
+            SELECT n.id, n.title, h.hash, n.note_type, n.created_at, n.updated_at
+            FROM notes n JOIN note_hashes h ON h.id = n.id
+        ''')
+        conn.execute('DROP TABLE notes')
+        conn.execute('ALTER TABLE notes_new RENAME TO notes')
+        if sequence:
+            conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'notes'", sequence)
+        conn.execute('CREATE INDEX idx_notes_updated ON notes (updated_at, id)')
+        conn.execute('CREATE INDEX idx_notes_type ON notes (note_type, updated_at, id)')
+        conn.execute('CREATE INDEX idx_notes_payload ON notes (payload_hash)')
+        conn.execute('''
+            UPDATE note_payloads
+            SET refcount = (SELECT COUNT(*) FROM notes WHERE payload_hash = note_payloads.hash)
+        ''')
+        
+        # 缩略图改为按内容哈希存放
+        conn.execute('''
+            CREATE TABLE note_renditions_new (
+                payload_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (payload_hash, size)
+            )
+        ''')
+        conn.execute('''
+            INSERT OR IGNORE INTO note_renditions_new (payload_hash, size, width, height, data)
+            SELECT h.hash, r.size, r.width, r.height, r.data
+            FROM note_renditions r JOIN note_hashes h ON h.id = r.note_id
+        ''')
+        conn.execute('DROP TABLE note_renditions')
+        conn.execute('ALTER TABLE note_renditions_new RENAME TO note_renditions')
+        conn.execute('DROP TABLE note_hashes')
+        
+        # 引用计数、全文索引和缩略图都由触发器维护
+        conn.execute('''
+            CREATE TRIGGER notes_payload_insert AFTER INSERT ON notes BEGIN
+                UPDATE note_payloads SET refcount = refcount + 1 WHERE hash = new.payload_hash;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER notes_payload_update AFTER UPDATE OF payload_hash ON notes
+            WHEN new.payload_hash IS NOT old.payload_hash BEGIN
+                UPDATE note_payloads SET refcount = refcount + 1 WHERE hash = new.payload_hash;
+                UPDATE note_payloads SET refcount = refcount - 1 WHERE hash = old.payload_hash;
+                DELETE FROM note_payloads WHERE hash = old.payload_hash AND refcount <= 0;
+                DELETE FROM note_renditions WHERE payload_hash = old.payload_hash
+                    AND NOT EXISTS (SELECT 1 FROM note_payloads WHERE hash = old.payload_hash);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER notes_payload_delete AFTER DELETE ON notes BEGIN
+                UPDATE note_payloads SET refcount = refcount - 1 WHERE hash = old.payload_hash;
+                DELETE FROM note_payloads WHERE hash = old.payload_hash AND refcount <= 0;
+                DELETE FROM note_renditions WHERE payload_hash = old.payload_hash
+                    AND NOT EXISTS (SELECT 1 FROM note_payloads WHERE hash = old.payload_hash);
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, title, body, note_type, created_at, updated_at)
+                VALUES (new.id, new.title, {FTS_BODY_SQL}, new.note_type, new.created_at, new.updated_at);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN
+                DELETE FROM notes_fts WHERE rowid = old.id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER notes_fts_update AFTER UPDATE ON notes BEGIN
+                UPDATE notes_fts
+                SET title = new.title,
+                    body = {FTS_BODY_SQL},
+                    note_type = new.note_type,
+                    created_at = new.created_at,
+                    updated_at = new.updated_at
+                WHERE rowid = new.id;
+            END
+        ''')
+    
+    def _migrate_payload_metadata(self, conn):
+        # 内容大小、类型和图片尺寸作为元数据存在notes中，
+        # 列表、搜索和统计只读notes，不需要访问内容数据
+        conn.execute('BEGIN')
+        for column, column_type in (('payload_size', 'INTEGER'), ('mime_type', 'TEXT'),
+                                    ('width', 'INTEGER'), ('height', 'INTEGER')):
+            conn.execute(f'ALTER TABLE notes ADD COLUMN {column} {column_type}')
+        # 图片只读取文件头来确定尺寸
+        rows = conn.execute('''
+            SELECT DISTINCT n.payload_hash, n.note_type, typeof(p.data),
+                   CASE typeof(p.data) WHEN 'text' THEN length(CAST(p.data AS BLOB)) ELSE length(p.data) END,
+                   substr(p.data, 1, 32)
+            FROM notes n JOIN note_payloads p ON p.hash = n.payload_hash
+        ''').fetchall()
+        for content_hash, note_type, value_type, size, header in rows:
+            if value_type == 'text':
+                mime_type, width, height = TEXT_MIME_TYPE, None, None
+            else:
+                _, mime_type, width, height = payload_metadata(header, note_type)
+            conn.execute('''
+                UPDATE notes SET payload_size = ?, mime_type = ?, width = ?, height = ?
+                WHERE payload_hash = ?
+            ''', (size, mime_type, width, height, content_hash))
+    
+    def _migrate_image_hashes(self, conn):
+        # 图片的感知哈希，用于查找相似的截图；已有的图片由后台补齐
+        conn.execute('ALTER TABLE notes ADD COLUMN dhash INTEGER')
+    
+    def _migrate_import_progress(self, conn):
+        # 批量导入时已经写入的文件，导入中断后重新运行可以从断点继续
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS import_progress (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            )
+        ''')
+    
+    def _migrate_incremental_vacuum(self, conn):
+        # 删除笔记后空闲的页可以用incremental_vacuum逐步还给文件系统；
+        # 已有的数据库需要VACUUM一次才能改变auto_vacuum，VACUUM不能在事务中执行；
+        # 数据库较大时需要几秒，在空闲维护中执行，被中断时整个VACUUM回滚，下次重新执行
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
     
     def get_connection(self):
-        return sqlite3.connect(self.db_file)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=10, check_same_thread=False,
+                                   cached_statements=CACHED_STATEMENTS)
+            self._configure_connection(conn)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _configure_connection(self, conn):
+        # 新建的数据库在写入文件头之前就能启用incremental_vacuum，不需要再整理一次
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # WAL模式下读写互不阻塞，synchronous=NORMAL时只在检查点才fsync
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = {-CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+    
+    def close(self):
+        """关闭所有线程打开的连接"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
     
     def add_note(self, title, content, note_type='text'):
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        content_hash = payload_hash(content)
+        # 图片笔记在保存时就生成缩略图，预览时直接读取；相同的图片已经有缩略图时跳过
+        renditions = []
+        dhash = None
+        if note_type == 'image':
+            if not self._has_renditions(content_hash):
+                renditions = self._build_renditions(content)
+            dhash = self._image_dhash(content_hash, content, renditions)
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            self._store_payload(cursor, content_hash, content)
             cursor.execute('''
-                INSERT INTO notes (title, content, note_type, created_at, updated_at)
+                INSERT INTO notes (title, payload_hash, note_type, created_at, updated_at,
+                                   payload_size, mime_type, width, height, dhash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (title, content_hash, note_type, current_time, current_time,
+                  *payload_metadata(content, note_type), dhash))
+            note_id = cursor.lastrowid
+            self._save_renditions(cursor, content_hash, renditions)
+            conn.commit()
+            return note_id
+    
+    def add_notes(self, notes, imported_files=()):
+        """在一个事务中批量写入prepare_note准备好的笔记，返回新笔记的id列表
+
+        imported_files是 [(路径, 大小, 修改时间), ...]，与笔记在同一个事务中记入
+        import_progress，中断后重新导入时跳过这些文件
+        """
+        notes = list(notes)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # 内容已存在时忽略，引用计数由notes表上的触发器维护
+            cursor.executemany('''
+                INSERT OR IGNORE INTO note_payloads (hash, data) VALUES (?, ?)
+            ''', ((note.content_hash, note.content) for note in notes))
+            cursor.executemany('''
+                INSERT INTO notes (title, payload_hash, note_type, created_at, updated_at,
+                                   payload_size, mime_type, width, height, dhash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', ((note.title, note.content_hash, note.note_type, note.created_at, note.created_at,
+                   note.payload_size, note.mime_type, note.width, note.height, note.dhash)
+                  for note in notes))
+            # 自增id在同一个事务中是连续的，由最后一条的id推算出全部
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            cursor.executemany('''
+                INSERT OR IGNORE INTO note_renditions (payload_hash, size, width, height, data)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (title, content, note_type, current_time, current_time))
+            ''', ((note.content_hash, *rendition) for note in notes for rendition in note.renditions))
+            cursor.executemany('''
+                INSERT OR REPLACE INTO import_progress (path, size, mtime) VALUES (?, ?, ?)
+            ''', imported_files)
             conn.commit()
+        return list(range(last_id - len(notes) + 1, last_id + 1)) if notes else []
+    
+    def get_imported_files(self):
+        """返回已经导入过的文件 {路径: (大小, 修改时间)}"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT path, size, mtime FROM import_progress')
+            return {path: (size, mtime) for path, size, mtime in cursor.fetchall()}
+    
+    def has_payload(self, content_hash):
+        """是否已经有笔记使用这个内容"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT 1 FROM note_payloads WHERE hash = ?',
+                                (content_hash,)).fetchone() is not None
+    
+    def _store_payload(self, cursor, content_hash, content):
+        """内容不存在时才写入，引用计数由notes表上的触发器维护"""
+        cursor.execute('SELECT 1 FROM note_payloads WHERE hash = ?', (content_hash,))
+        if cursor.fetchone() is None:
+            cursor.execute('''
+                INSERT OR IGNORE INTO note_payloads (hash, data) VALUES (?, ?)
+            ''', (content_hash, content))
+    
+    def _has_renditions(self, content_hash):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1 FROM note_renditions WHERE payload_hash = ? LIMIT 1', (content_hash,))
+            return cursor.fetchone() is not None
+    
+    def _build_renditions(self, content):
+        try:
+            return build_renditions(content)
+        except Exception as e:
+            print(f"生成缩略图失败: {e}")
+            return []
+    
+    def _image_dhash(self, content_hash, content, renditions=()):
+        """返回图片内容的感知哈希（有符号64位，直接存入INTEGER列）
+
+        相同的图片已经保存过时复用它的哈希，否则从最小的缩略图计算，不必解码原图
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT dhash FROM notes WHERE payload_hash = ? AND dhash IS NOT NULL LIMIT 1
+            ''', (content_hash,))
+            result = cursor.fetchone()
+        if result:
+            return result[0]
+        return stored_dhash(min(renditions)[3] if renditions else content)
+    
+    def _save_renditions(self, cursor, content_hash, renditions):
+        cursor.executemany('''
+            INSERT OR REPLACE INTO note_renditions (payload_hash, size, width, height, data)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(content_hash, *rendition) for rendition in renditions])
+    
+    def get_preview_image(self, note_id, width, height):
+        """返回能填满 width x height 预览区的最小一张缩略图数据
+
+        缩略图与原图宽高比相同，只要有一边达到预览区大小就不需要放大；
+        没有合适的缩略图时返回None，由调用方读取原图
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT r.data
+                FROM notes n
+                JOIN note_renditions r ON r.payload_hash = n.payload_hash
+                WHERE n.id = ? AND (r.width >= ? OR r.height >= ?)
+                ORDER BY r.size
+                LIMIT 1
+            ''', (note_id, width, height))
+            result = cursor.fetchone()
+            return result[0] if result else None
+    
+    def backfill_renditions(self):
+        """为还没有缩略图的图片补充生成缩略图，返回处理的图片数量
+
+        比最小的缩略图尺寸还小的图片不需要缩略图，直接跳过；每张图片单独提交，适合在后台线程中运行
+        """
+        processed = 0
+        failed = set()
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT DISTINCT payload_hash
+                    FROM notes
+                    WHERE note_type = 'image'
+                      AND (width IS NULL OR MAX(width, height) * ? > ?)
+                      AND NOT EXISTS (SELECT 1 FROM note_renditions r WHERE r.payload_hash = notes.payload_hash)
+                ''', (RENDITION_MIN_REDUCTION, min(RENDITION_SIZES)))
+                hashes = [row[0] for row in cursor.fetchall() if row[0] not in failed]
+            if not hashes:
+                return processed
+            for content_hash in hashes:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT data FROM note_payloads WHERE hash = ?', (content_hash,))
+                    result = cursor.fetchone()
+                renditions = self._build_renditions(result[0]) if result else []
+                if not renditions:
+                    failed.add(content_hash)
+                    continue
+                with self.get_connection() as conn:
+                    self._save_renditions(conn.cursor(), content_hash, renditions)
+                processed += 1
+    
+    def backfill_image_hashes(self):
+        """为还没有感知哈希的图片补充计算哈希，返回处理的图片数量
+
+        优先使用最小的缩略图计算，每张图片单独提交，适合在后台线程中运行
+        """
+        processed = 0
+        failed = set()
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT DISTINCT payload_hash
+                    FROM notes
+                    WHERE note_type = 'image' AND dhash IS NULL
+                ''')
+                hashes = [row[0] for row in cursor.fetchall() if row[0] not in failed]
+            if not hashes:
+                return processed
+            for content_hash in hashes:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        SELECT data FROM note_renditions WHERE payload_hash = ? ORDER BY size LIMIT 1
+                    ''', (content_hash,))
+                    result = cursor.fetchone()
+                    if result is None:
+                        cursor.execute('SELECT data FROM note_payloads WHERE hash = ?', (content_hash,))
+                        result = cursor.fetchone()
+                dhash = self._image_dhash(content_hash, result[0]) if result else None
+                if dhash is None:
+                    failed.add(content_hash)
+                    continue
+                with self.get_connection() as conn:
+                    conn.execute('''
+                        UPDATE notes SET dhash = ? WHERE payload_hash = ? AND note_type = 'image'
+                    ''', (dhash, content_hash))
+                    conn.commit()
+                processed += 1
+    
+    def get_image_hashes(self):
+        """返回所有已计算感知哈希的图片笔记 [(id, dhash), ...]，哈希为64位无符号整数"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, dhash FROM notes WHERE note_type = 'image' AND dhash IS NOT NULL
+            ''')
+            return [(note_id, dhash & DHASH_MASK) for note_id, dhash in cursor.fetchall()]
+    
+    def get_image_hash(self, note_id):
+        """返回一条图片笔记的感知哈希，还没有计算时返回None"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT dhash FROM notes WHERE id = ?', (note_id,))
+            result = cursor.fetchone()
+            return result[0] & DHASH_MASK if result and result[0] is not None else None
     
     def get_all_notes(self):
         with self.get_connection() as conn:
@@ -41,18 +718,94 @@ class DatabaseManager:
             cursor.execute('''
                 SELECT id, title, created_at, updated_at, note_type
                 FROM notes
-                ORDER BY updated_at DESC
+                ORDER BY updated_at DESC, id DESC
             ''')
             return cursor.fetchall()
     
-    def get_note_content(self, note_id):
+    def count_notes(self):
+        with self.get_connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+    
+    def iter_notes(self, after=None, before=None, limit=PAGE_SIZE, note_type=None):
+        """按 (updated_at, id) 键集分页读取笔记，结果按更新时间从新到旧排列
+
+        after=(updated_at, id) 返回比该位置更旧的一页，
+        before=(updated_at, id) 返回紧挨着该位置、更新的一页
+        """
+        conditions = []
+        params = []
+        if note_type is not None:
+            conditions.append('note_type = ?')
+            params.append(note_type)
+        if after is not None:
+            conditions.append('(updated_at, id) < (?, ?)')
+            params.extend(after)
+        if before is not None:
+            conditions.append('(updated_at, id) > (?, ?)')
+            params.extend(before)
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        # 向前翻页时先按升序取离该位置最近的一页，再翻转成降序
+        order = 'ASC' if before is not None else 'DESC'
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, title, created_at, updated_at, note_type
+                FROM notes
+                {where}
+                ORDER BY updated_at {order}, id {order}
+                LIMIT ?
+            ''', (*params, limit))
+            notes = cursor.fetchall()
+        if before is not None:
+            notes.reverse()
+        return notes
+    
+    def get_note_meta(self, note_id):
+        """读取单条笔记的列表信息 (id, title, created_at, updated_at, note_type)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, title, created_at, updated_at, note_type
+                FROM notes
+                WHERE id = ?
+            ''', (note_id,))
+            return cursor.fetchone()
+
+    def get_notes_meta(self, note_ids):
+        """批量读取多条笔记的列表信息，按note_ids的顺序返回，已不存在的笔记被跳过"""
+        if not note_ids:
+            return []
+        placeholders = ','.join('?' * len(note_ids))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, title, created_at, updated_at, note_type
+                FROM notes
+                WHERE id IN ({placeholders})
+            ''', tuple(note_ids))
+            notes = {note[0]: note for note in cursor.fetchall()}
+        return [notes[note_id] for note_id in note_ids if note_id in notes]
+
+    def get_note_info(self, note_id):
+        """读取笔记内容的元数据，返回 (note_type, payload_size, mime_type, width, height)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT title, content, note_type
+                SELECT note_type, payload_size, mime_type, width, height
                 FROM notes
                 WHERE id = ?
             ''', (note_id,))
+            return cursor.fetchone()
+    
+    def get_note_content(self, note_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT n.title, p.data, n.note_type
+                FROM notes n
+                JOIN note_payloads p ON p.hash = n.payload_hash
+                WHERE n.id = ?
+            ''', (note_id,))
             result = cursor.fetchone()
             if result:
                 title, content, note_type = result
@@ -66,15 +819,48 @@ class DatabaseManager:
                 return title, content, note_type
             return None, None, None
     
+    def open_payload(self, note_id):
+        """以只读文件对象的形式打开笔记内容，笔记不存在时返回None
+
+        PIL可以直接从返回的流中解码图片，导出时也可以分块复制
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT p.rowid
+            FROM notes n
+            JOIN note_payloads p ON p.hash = n.payload_hash
+            WHERE n.id = ?
+        ''', (note_id,))
+        result = cursor.fetchone()
+        if result is None:
+            return None
+        return open_payload_stream(conn, result[0])
+    
     def update_note(self, note_id, title, content):
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        content_hash = payload_hash(content)
+        result = self.get_connection().execute('SELECT note_type FROM notes WHERE id = ?', (note_id,)).fetchone()
+        note_type = result[0] if result else 'text'
+        # 与add_note相同，缩略图和感知哈希在开始写入事务之前准备好，事务中只写入
+        renditions = []
+        dhash = None
+        if note_type == 'image':
+            if not self._has_renditions(content_hash):
+                renditions = self._build_renditions(content)
+            dhash = self._image_dhash(content_hash, content, renditions)
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            self._store_payload(cursor, content_hash, content)
+            payload_size, mime_type, width, height = payload_metadata(content, note_type)
             cursor.execute('''
                 UPDATE notes
-                SET title = ?, content = ?, updated_at = ?
+                SET title = ?, payload_hash = ?, updated_at = ?,
+                    payload_size = ?, mime_type = ?, width = ?, height = ?, dhash = ?
                 WHERE id = ?
-            ''', (title, content, current_time, note_id))
+            ''', (title, content_hash, current_time, payload_size, mime_type, width, height, dhash,
+                  note_id))
+            self._save_renditions(cursor, content_hash, renditions)
             conn.commit()
     
     def delete_note(self, note_id):
@@ -83,13 +869,270 @@ class DatabaseManager:
             cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
             conn.commit()
     
-    def search_notes_by_title(self, search_text):
+    def delete_notes(self, note_ids):
+        """在一个事务中删除多条笔记，返回删除的数量
+
+        删除后空出的页留在空闲列表中，由incremental_vacuum分步释放
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, title, created_at, updated_at, note_type
-                FROM notes
-                WHERE title LIKE ?
-                ORDER BY updated_at DESC
-            ''', (f'%{search_text}%',))
-            return cursor.fetchall()
\ No newline at end of file
+            cursor.executemany('DELETE FROM notes WHERE id = ?', [(note_id,) for note_id in note_ids])
+            deleted = cursor.rowcount
+            conn.commit()
+        return deleted
+    
+    def incremental_vacuum(self, pages=VACUUM_STEP_PAGES):
+        """释放最多pages个空闲页，返回剩余的空闲页数量
+
+        每次只处理一小步，写入事务很短，不会长时间阻塞其他写入
+        """
+        conn = self.get_connection()
+        # 这条语句每执行一步只释放一页，execute()只会执行第一步，
+        # executescript()会一直执行到结束（执行前会先提交当前事务）
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        return conn.execute('PRAGMA freelist_count').fetchone()[0]
+    
+    def analyze(self, table):
+        """更新一张表的查询计划统计信息，读取的行数受ANALYSIS_LIMIT限制"""
+        conn = self.get_connection()
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        conn.execute(f'ANALYZE {table}')
+        if conn.in_transaction:
+            conn.commit()
+    
+    def checkpoint(self):
+        """把WAL中的内容合并回数据库文件，不等待正在进行的读写，返回 (是否受阻, WAL页数, 已合并页数)"""
+        return self.get_connection().execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    
+    def merge_search_index(self, pages):
+        """合并全文索引的段，每次最多写入约pages页，返回是否还有可以合并的段"""
+        with self.get_connection() as conn:
+            before = conn.total_changes
+            # 负数表示不论段的数量多少都进行合并，最终合并为一个段
+            conn.execute("INSERT INTO notes_fts (notes_fts, rank) VALUES ('merge', ?)", (-pages,))
+            conn.commit()
+            # 修改的行数少于2说明已经没有需要合并的段
+            return conn.total_changes - before >= 2
+    
+    def quick_check(self, table):
+        """检查一张表及其索引的结构，返回发现的问题列表，正常时为空"""
+        rows = self.get_connection().execute(f'PRAGMA quick_check({table})').fetchall()
+        return [row[0] for row in rows if row[0] != 'ok']
+    
+    def get_storage_stats(self):
+        """统计数据库文件的空间占用
+
+        返回的字典包含页大小、总页数、空闲页数、数据库和WAL文件的大小，
+        tables为 [(表或索引名, 页数, 字节数, 未使用的字节数), ...]，SQLite不支持dbstat时为None；
+        types为 [(笔记类型, 笔记数, 内容总字节数, 去重后的字节数), ...]；
+        renditions为 (缩略图数量, 字节数)
+        """
+        conn = self.get_connection()
+        wal_file = self.db_file + '-wal'
+        stats = {
+            'page_size': conn.execute('PRAGMA page_size').fetchone()[0],
+            'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+            'freelist_count': conn.execute('PRAGMA freelist_count').fetchone()[0],
+            'file_size': os.path.getsize(self.db_file),
+            'wal_size': os.path.getsize(wal_file) if os.path.exists(wal_file) else 0,
+        }
+        try:
+            # aggregate模式下每张表或索引一行，pageno列是它占用的页数
+            stats['tables'] = conn.execute('''
+                SELECT name, pageno, pgsize, unused FROM dbstat WHERE aggregate = 1
+                ORDER BY pgsize DESC
+            ''').fetchall()
+        except sqlite3.OperationalError:
+            stats['tables'] = None
+        # 大小都取自notes中记录的字节数，不读取内容本身；去重后的大小每个内容只算一次
+        stats['types'] = conn.execute('''
+            SELECT t.note_type, t.count, t.size, s.stored
+            FROM (SELECT note_type, COUNT(*) AS count, TOTAL(payload_size) AS size
+                  FROM notes GROUP BY note_type) AS t
+            JOIN (SELECT note_type, TOTAL(payload_size) AS stored
+                  FROM (SELECT DISTINCT note_type, payload_hash, payload_size FROM notes)
+                  GROUP BY note_type) AS s ON s.note_type = t.note_type
+            ORDER BY t.note_type
+        ''').fetchall()
+        stats['renditions'] = conn.execute(
+            'SELECT COUNT(*), TOTAL(LENGTH(data)) FROM note_renditions').fetchone()
+        return stats
+    
+    def search_notes_by_title(self, search_text, limit=SEARCH_LIMIT):
+        return [note[:5] for note in self.search_notes(search_text, limit, title_only=True)]
+    
+    def search_notes(self, search_text, limit=SEARCH_LIMIT, title_only=False):
+        """全文搜索标题和文本内容
+
+        返回 (id, title, created_at, updated_at, note_type, 高亮标题, 内容摘要, 内容开头, 小写的标题和内容开头)，
+        按相关度排序。内容开头最多 SEARCH_EXCERPT_CHARS + 1 个字，超过时说明内容被截断。
+        匹配的笔记超过limit条时，只在最新创建的limit条中排序
+        """
+        terms = search_text.split()
+        if not terms:
+            return []
+        # 更短的词退回LIKE，此时扫描的也只是全文索引表中的文本，不会读到图片数据
+        if not uses_full_text_index(search_text):
+            return self._search_notes_like(terms, limit, title_only)
+        
+        query = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        if title_only:
+            query = 'title : (' + query + ')'
+        with self.get_connection() as conn:
+            # 按rowid倒序取前limit条匹配的行，读够就停止；不使用bm25()，
+            # 它要为每个搜索词扫描全部匹配的行，常见的词在几万条笔记中需要几十毫秒
+            cursor = conn.execute('''
+                SELECT rowid, title, created_at, updated_at, note_type, substr(body, 1, ?)
+                FROM notes_fts
+                WHERE notes_fts MATCH ?
+                ORDER BY rowid DESC
+                LIMIT ?
+            ''', (SEARCH_EXCERPT_CHARS + 1, query, limit))
+            notes = [_search_result(row, terms, title_only) for row in cursor.fetchall()]
+        return _rank_search_results(notes, terms, title_only)
+    
+    def _search_notes_like(self, terms, limit, title_only):
+        conditions = []
+        params = []
+        for term in terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            if title_only:
+                conditions.append("f.title LIKE ? ESCAPE '\\'")
+                params.append(pattern)
+            else:
+                conditions.append("(f.title LIKE ? ESCAPE '\\' OR f.body LIKE ? ESCAPE '\\')")
+                params.extend((pattern, pattern))
+        with self.get_connection() as conn:
+            # CROSS JOIN让SQLite按更新时间的索引从最新的笔记开始逐条检查，
+            # 找够limit条后立即停止；没有足够的匹配时检查整张表，不会漏掉较早的笔记
+            cursor = conn.execute(f'''
+                SELECT f.rowid, f.title, f.created_at, f.updated_at, f.note_type, substr(f.body, 1, ?)
+                FROM notes n
+                CROSS JOIN notes_fts f ON f.rowid = n.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY n.updated_at DESC, n.id DESC
+                LIMIT ?
+            ''', (SEARCH_EXCERPT_CHARS + 1, *params, limit))
+            rows = cursor.fetchall()
+        return [_search_result(row, terms, title_only) for row in rows]
+
+
+def uses_full_text_index(search_text):
+    """搜索词是否都能用全文索引查询：trigram分词器只能用不少于3个字的词做MATCH查询
+
+    否则search_notes退回LIKE，结果按更新时间排序，不能与全文搜索的结果互相筛选
+    """
+    terms = search_text.split()
+    return bool(terms) and all(len(term) >= 3 for term in terms)
+
+
+def _rank_search_results(notes, terms, title_only=False):
+    """按BM25的公式计算相关度排序，内容只统计开头的 SEARCH_EXCERPT_CHARS 个字
+
+    结果都包含全部搜索词，省略了各个词的逆文档频率；相关度相同时保持原来的顺序（新的在前）
+    """
+    if not notes:
+        return notes
+    lowered_terms = [term.lower() for term in terms]
+    columns = []
+    for note in notes:
+        # 小写的标题和内容开头之间用换行分隔
+        title, _, body = note[8].partition('\n')
+        columns.append((title, '' if title_only else body))
+    average_title = sum(len(title) for title, body in columns) / len(columns) or 1
+    average_body = sum(len(body) for title, body in columns) / len(columns) or 1
+    scores = []
+    for title, body in columns:
+        # 词频饱和：count / (count + k1 * (1 - b + b * 长度 / 平均长度))，省略了不影响排序的常数因子 k1 + 1
+        title_norm = SEARCH_RANK_K1 * (1 - SEARCH_RANK_B + SEARCH_RANK_B * len(title) / average_title)
+        body_norm = SEARCH_RANK_K1 * (1 - SEARCH_RANK_B + SEARCH_RANK_B * len(body) / average_body)
+        score = 0.0
+        for term in lowered_terms:
+            count = title.count(term)
+            if count:
+                score += SEARCH_TITLE_WEIGHT * count / (count + title_norm)
+            count = body.count(term)
+            if count:
+                score += count / (count + body_norm)
+        scores.append(score)
+    order = sorted(range(len(notes)), key=lambda index: -scores[index])
+    return [notes[index] for index in order]
+
+
+def _search_result(row, terms, title_only=False):
+    note_id, title, created_at, updated_at, note_type, excerpt = row
+    excerpt = excerpt or ''
+    # 预先转换为小写，继续输入时在结果中筛选不需要再转换；搜索词中没有空白，不会跨过换行匹配
+    lowered_title = title.lower()
+    lowered_excerpt = excerpt.lower()
+    lowered = lowered_title + '\n' + lowered_excerpt
+    snippet = '' if title_only else _snippet(excerpt, terms, lowered=lowered_excerpt)
+    return (note_id, title, created_at, updated_at, note_type,
+            _highlight(title, terms, lowered_title), snippet, excerpt, lowered)
+
+
+def narrow_search_results(notes, search_text):
+    """在上一次的搜索结果中继续筛选，不再查询数据库
+
+    搜索按子串匹配，新的搜索词是在上一次的基础上继续输入得到的时候，
+    新的结果一定是上一次结果的子集，保持原来的排序，只重新生成高亮和摘要。
+    两次搜索都应该使用全文索引（见uses_full_text_index），LIKE的结果排序不同，不能用来筛选。
+    结果中只有内容的开头，某条笔记的内容被截断、又不能确定是否匹配时返回None，需要重新查询
+    """
+    terms = search_text.split()
+    lowered_terms = [term.lower() for term in terms]
+    narrowed = []
+    for note in notes:
+        title, excerpt, lowered = note[1], note[7], note[8]
+        if all(term in lowered for term in lowered_terms):
+            narrowed.append(note[:5] + (_highlight(title, terms), _snippet(excerpt, terms), excerpt, lowered))
+        elif len(excerpt) > SEARCH_EXCERPT_CHARS:
+            return None
+    return narrowed
+
+
+def _highlight(text, terms, lowered=None):
+    """用高亮标记包围text中出现的所有搜索词（不区分大小写），已经转换过的小写文字可以通过lowered传入"""
+    if lowered is None:
+        lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = text
+    spans = []
+    for term in terms:
+        term = term.lower()
+        start = lowered.find(term)
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = lowered.find(term, start + 1)
+    if not spans:
+        return text
+    # 重叠或相邻的匹配合并为一段，整段切片拼接，不逐字处理
+    spans.sort()
+    result = []
+    position = 0
+    start, end = spans[0]
+    for span_start, span_end in spans[1:]:
+        if span_start <= end:
+            end = max(end, span_end)
+            continue
+        result += (text[position:start], HIGHLIGHT_OPEN, text[start:end], HIGHLIGHT_CLOSE)
+        position = end
+        start, end = span_start, span_end
+    result += (text[position:start], HIGHLIGHT_OPEN, text[start:end], HIGHLIGHT_CLOSE, text[end:])
+    return ''.join(result)
+
+
+def _snippet(text, terms, width=24, lowered=None):
+    """截取text中第一个搜索词附近的一段文字并高亮，已经转换过的小写文字可以通过lowered传入"""
+    if not text:
+        return ''
+    if lowered is None:
+        lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = text
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [pos for pos in positions if pos != -1]
+    start = max(min(positions) - width // 2, 0) if positions else 0
+    end = min(start + width * 2, len(text))
+    fragment = text[start:end].replace('\n', ' ')
+    return ('…' if start > 0 else '') + _highlight(fragment, terms) + ('…' if end < len(text) else '')
\ No newline at end of file
@@ -0,0 +1,246 @@
+import threading
+from array import array
+
+# 候选标题至少要包含搜索词中这一比例的字符对才算匹配
+MIN_SIMILARITY = 0.5
+# 已删除的条目超过这个数量且多于有效条目时压缩倒排表
+COMPACT_THRESHOLD = 1000
+# 按缩写匹配时最多检查的候选标题数量，从最新的条目开始检查
+ABBREVIATION_SCAN_LIMIT = 500
+# 候选数量乘以这个倍数仍少于倒排表长度时，在倒排表中二分查找候选，否则直接计数整个倒排表
+SEARCHSORTED_RATIO = 8
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def title_grams(text):
+    """标题的索引项：相邻两个字符组成的无序字符对，以及非ASCII的单个字符
+
+    字符对不区分先后顺序，"ngnix" 和 "nginx" 仍有大部分字符对相同，能容忍相邻字符颠倒；
+    中文标题较短且单字区分度高，额外索引单字，打错一个字时也能找到
+    """
+    grams = set()
+    for first, second in zip(text, text[1:]):
+        if first == ' ' or second == ' ':
+            continue
+        grams.add(first + second if first <= second else second + first)
+    for char in text:
+        if ord(char) > 127 and char != ' ':
+            grams.add(char)
+    return grams
+
+
+def subsequence_span(query, text):
+    """query的字符按顺序出现在text中时，返回覆盖它们的最短片段长度，否则返回None
+
+    用于匹配缩写，例如 "ngxcf" 可以匹配 "nginx conf"
+    """
+    query = query.replace(' ', '')
+    if not query:
+        return None
+    best = None
+    start = text.find(query[0])
+    while start != -1:
+        position = start
+        for char in query[1:]:
+            position = text.find(char, position + 1)
+            if position == -1:
+                return best
+        if best is None or position - start + 1 < best:
+            best = position - start + 1
+        start = text.find(query[0], start + 1)
+    return best
+
+
+class TitleIndex:
+    """笔记标题的内存模糊索引
+
+    倒排表把每个索引项映射到包含它的条目编号，编号用紧凑的数组保存；
+    另有按单个字符的倒排表，缩写与标题共有的字符对很少，用它找出包含缩写全部字符的标题。
+    修改标题时分配新的条目编号，旧编号作废，查询时跳过，积累到一定数量后压缩
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._chars = {}
+        # 条目编号 -> (note_id, 规范化的标题, 索引项数量)
+        self._docs = {}
+        self._docno_by_note = {}
+        self._next_docno = 0
+        self._dead = 0
+        # 按条目编号记录条目是否有效，搜索时整体过滤作废的编号
+        self._alive = bytearray()
+
+    def __len__(self):
+        return len(self._docno_by_note)
+
+    def build(self, notes):
+        """用 (id, title, ...) 形式的笔记列表批量建立索引
+
+        建立索引期间新增或修改过的笔记已经是最新的标题，不再用读取到的旧标题覆盖
+        """
+        for note in notes:
+            if note[0] not in self._docno_by_note:
+                self.add(note[0], note[1])
+
+    def add(self, note_id, title):
+        normalized = normalize(title)
+        grams = title_grams(normalized)
+        with self._lock:
+            self._remove(note_id)
+            # 条目编号递增分配，每个倒排表中的编号都是从小到大排列的
+            docno = self._next_docno
+            self._next_docno += 1
+            self._alive.append(1)
+            self._docs[docno] = (note_id, normalized, len(grams))
+            self._docno_by_note[note_id] = docno
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = array('I')
+                postings.append(docno)
+            for char in set(normalized.replace(' ', '')):
+                postings = self._chars.get(char)
+                if postings is None:
+                    postings = self._chars[char] = array('I')
+                postings.append(docno)
+
+    def remove(self, note_id):
+        with self._lock:
+            self._remove(note_id)
+            if self._dead > COMPACT_THRESHOLD and self._dead > len(self._docs):
+                self._compact()
+
+    def search(self, query, limit=20, min_similarity=MIN_SIMILARITY):
+        """返回 [(note_id, score), ...]，按相似度从高到低排列
+
+        候选来自两部分：共有足够多字符对的标题，以及按顺序包含搜索词全部字符的标题（缩写）
+        """
+        normalized = normalize(query)
+        query_grams = title_grams(normalized)
+        if not query_grams:
+            return []
+        needed = max(1, int(len(query_grams) * min_similarity + 0.999))
+        # numpy导入较慢，搜索和建立索引都在后台线程中进行，第一次搜索时才导入
+        import numpy as np
+        with self._lock:
+            alive = np.frombuffer(bytes(self._alive), dtype=np.uint8)
+            candidates = self._gram_candidates(np, query_grams, needed, limit * 4, alive)
+            # 缩写只有在按字符对找到的标题不够多时才补充，它们的得分通常排在后面
+            abbreviations = []
+            if len(candidates) < limit:
+                abbreviations = self._abbreviation_candidates(
+                    np, normalized, {docno for count, docno in candidates}, limit - len(candidates), alive)
+            scored = []
+            for count, docno in candidates:
+                note_id, title, gram_count = self._docs[docno]
+                # 搜索词的字符对在标题中出现的比例为主，标题越接近搜索词长度得分越高
+                score = count / len(query_grams) + 0.2 * count / gram_count
+                if normalized in title:
+                    score += 1.0
+                else:
+                    # 字符按顺序出现且分布得比较紧凑时，可能是缩写
+                    span = subsequence_span(normalized, title)
+                    if span is not None and span <= len(normalized) * 2:
+                        score += 0.3
+                scored.append((score, note_id))
+            for docno in abbreviations:
+                note_id, title, gram_count = self._docs[docno]
+                count = len(query_grams & title_grams(title))
+                scored.append((count / len(query_grams) + 0.2 * count / gram_count + 0.3, note_id))
+        scored.sort(key=lambda item: -item[0])
+        return [(note_id, score) for score, note_id in scored[:limit]]
+
+    def _gram_candidates(self, np, query_grams, needed, limit, alive):
+        """返回至少命中needed个索引项的条目中命中最多的limit个 [(命中数, 条目编号), ...]"""
+        # 从最少见的索引项开始处理；复制一份倒排表，不引用array的缓冲区，
+        # 否则释放锁后其他线程向倒排表追加条目时会失败
+        present = sorted((np.array(postings, dtype=np.uint32)
+                          for postings in map(self._postings.get, query_grams) if postings), key=len)
+        if len(present) < needed:
+            return []
+        # 至少命中needed个索引项的标题，一定包含最少见的 len(present) - needed + 1 个之一，
+        # 只有这几个索引项中的条目是候选
+        prefix = len(present) - needed + 1
+        counts = np.bincount(np.concatenate(present[:prefix]), minlength=self._next_docno).astype(np.uint16)
+        candidates = np.flatnonzero(counts)
+        # 其余较常见的索引项只给候选计数：候选较少时在倒排表中二分查找，否则整体计数。
+        # 剩下的索引项全部命中也达不到needed的候选提前去掉，没有候选时停止
+        for index in range(prefix, len(present)):
+            postings = present[index]
+            if len(candidates) * SEARCHSORTED_RATIO < len(postings):
+                positions = np.minimum(np.searchsorted(postings, candidates), len(postings) - 1)
+                counts[candidates] += postings[positions] == candidates
+            else:
+                counts[postings] += 1
+            threshold = needed - (len(present) - index - 1)
+            if threshold > 1:
+                candidates = candidates[counts[candidates] >= threshold]
+                if not len(candidates):
+                    return []
+        candidates = candidates[(counts[candidates] >= needed) & (alive[candidates] == 1)]
+        # 先按命中的索引项数量粗选，数量相同时较新的条目优先，再对少量候选计算精确得分
+        keys = (counts[candidates].astype(np.int64) << 32) | candidates
+        if len(keys) > limit:
+            keys = np.partition(keys, len(keys) - limit)[-limit:]
+        return [(int(key) >> 32, int(key) & 0xFFFFFFFF) for key in np.sort(keys)[::-1]]
+
+    def _abbreviation_candidates(self, np, normalized, exclude, limit, alive):
+        """返回按顺序紧凑地包含搜索词全部字符的条目编号，例如 "ngxcf" 对应 "nginx conf"
+
+        先用单字符的倒排表求出包含全部字符的条目，再从最新的条目开始检查字符顺序，
+        最多检查 ABBREVIATION_SCAN_LIMIT 个
+        """
+        chars = set(normalized.replace(' ', ''))
+        if len(chars) < 2:
+            return []
+        postings = [self._chars.get(char) for char in chars]
+        if not all(postings):
+            return []
+        postings = sorted((np.array(docnos, dtype=np.uint32) for docnos in postings), key=len)
+        candidates = postings[0]
+        for docnos in postings[1:]:
+            # 与 _gram_candidates 相同：候选较少时二分查找，否则标记整个倒排表
+            if len(candidates) * SEARCHSORTED_RATIO < len(docnos):
+                positions = np.minimum(np.searchsorted(docnos, candidates), len(docnos) - 1)
+                candidates = candidates[docnos[positions] == candidates]
+            else:
+                present = np.zeros(self._next_docno, dtype=bool)
+                present[docnos] = True
+                candidates = candidates[present[candidates]]
+            if not len(candidates):
+                return []
+        candidates = candidates[alive[candidates] == 1]
+        found = []
+        for docno in candidates[::-1][:ABBREVIATION_SCAN_LIMIT].tolist():
+            if docno in exclude:
+                continue
+            span = subsequence_span(normalized, self._docs[docno][1])
+            if span is not None and span <= len(normalized) * 2:
+                found.append(docno)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _remove(self, note_id):
+        docno = self._docno_by_note.pop(note_id, None)
+        if docno is not None:
+            del self._docs[docno]
+            self._alive[docno] = 0
+            self._dead += 1
+
+    def _compact(self):
+        self._postings = self._compact_postings(self._postings)
+        self._chars = self._compact_postings(self._chars)
+        self._dead = 0
+
+    def _compact_postings(self, postings):
+        compacted = {}
+        for key, docnos in postings.items():
+            alive = array('I', (docno for docno in docnos if docno in self._docs))
+            if alive:
+                compacted[key] = alive
+        return compacted
@@ -0,0 +1,78 @@
+import time
+from perf_trace import LatencyHistogram
+
+# 同一个快捷键在上次处理后这么短的时间（毫秒）内再次按下时不再处理，例如按住不放时的自动重复
+HOTKEY_REPEAT_MS = 300
+# 按下快捷键后超过这个时间（秒）才显示的窗口不计入响应时间，例如快捷键没有打开窗口时
+HOTKEY_LATENCY_TIMEOUT = 5
+
+
+class HotkeyQueue:
+    """把全局快捷键交给Tk主线程处理，并统计从按下快捷键到窗口显示的时间
+
+    快捷键的监听线程只调用post()，记下快捷键的名称和按下的时间，通过dispatcher.post_now()
+    立即唤醒主线程处理，不直接访问其他Tk对象；同一个快捷键距离上次处理不到HOTKEY_REPEAT_MS时
+    合并掉，有对话框打开时（is_busy()返回True，或者上一个快捷键的处理函数还在等待消息框）
+    到达的事件直接丢弃。处理函数打开的窗口显示后调用mark_shown()记录响应时间
+    """
+
+    def __init__(self, dispatcher, handlers, is_busy, tracer=None, repeat_ms=HOTKEY_REPEAT_MS):
+        self.dispatcher = dispatcher
+        # {快捷键名称: 处理函数}，处理函数在主线程中调用
+        self.handlers = handlers
+        self.is_busy = is_busy
+        self.tracer = tracer
+        self.repeat_ns = repeat_ms * 1000000
+        # 每个快捷键从按下到窗口显示的耗时
+        self.histograms = {}
+        self.coalesced = 0
+        self.dropped = 0
+        # 每个快捷键上次开始处理的时间
+        self._last_dispatch = {}
+        self._pressed = None
+        self._dispatching = False
+
+    def post(self, name):
+        """可在任意线程中调用，记录按下的时间，稍后在主线程中处理"""
+        self.dispatcher.post_now(self._dispatch, name, time.perf_counter_ns())
+
+    def _dispatch(self, name, pressed_ns):
+        # 上次处理之后很快又按下（包括在上次处理之前就已经排队的事件）时只处理一次
+        last = self._last_dispatch.get(name)
+        if last is not None and pressed_ns - last < self.repeat_ns:
+            self.coalesced += 1
+            return
+        # 处理函数打开消息框时，主线程会在消息框的事件循环中再次进入这里
+        if self._dispatching or self.is_busy():
+            self.dropped += 1
+            return
+        self._last_dispatch[name] = time.perf_counter_ns()
+        self._pressed = (name, pressed_ns)
+        self._dispatching = True
+        try:
+            self.handlers[name]()
+        except Exception as e:
+            print(f"处理快捷键失败: {e}")
+        finally:
+            self._dispatching = False
+
+    def mark_shown(self):
+        """快捷键打开的窗口显示后在主线程中调用，记录从按下快捷键到现在的时间"""
+        if self._pressed is None:
+            return
+        name, pressed_ns = self._pressed
+        self._pressed = None
+        shown_ns = time.perf_counter_ns()
+        if shown_ns - pressed_ns > HOTKEY_LATENCY_TIMEOUT * 1e9:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record((shown_ns - pressed_ns) / 1e6)
+        if self.tracer is not None and self.tracer.enabled:
+            self.tracer.record(f'hotkey.{name}', pressed_ns, shown_ns)
+
+    def stats(self):
+        """返回 [(名称, 次数, p50, p99, 最大值), ...]，时间单位为毫秒"""
+        return [(name, h.count, h.percentile(50), h.percentile(99), h.max_ms)
+                for name, h in sorted(self.histograms.items())]
@@ -0,0 +1,111 @@
+import threading
+from itertools import combinations
+
+# 查找相似图片时允许的最大汉明距离（64位dHash）
+SIMILAR_MAX_DISTANCE = 10
+# 哈希切分成的段数和每段的位数
+BLOCK_COUNT = 4
+BLOCK_BITS = 16
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _flip_masks(bits, radius):
+    """bits位以内最多翻转radius位的所有掩码"""
+    masks = []
+    for count in range(radius + 1):
+        for positions in combinations(range(bits), count):
+            mask = 0
+            for position in positions:
+                mask |= 1 << position
+            masks.append(mask)
+    return masks
+
+
+class ImageHashIndex:
+    """图片感知哈希的多段索引，按汉明距离查找相似的图片
+
+    64位哈希切成4段，每段建一张 段值 -> 哈希集合 的表。两个哈希的距离不超过r时，
+    至少有一段的距离不超过 r // 4，所以只需在每段中查找翻转了少量位的段值，
+    再对得到的少量候选计算完整距离。查找代价取决于候选数量，与图片总数几乎无关。
+    相同的哈希（重复保存的截图）只索引一次
+    """
+
+    def __init__(self, max_distance=SIMILAR_MAX_DISTANCE):
+        self._lock = threading.Lock()
+        self.max_distance = max_distance
+        self._masks = _flip_masks(BLOCK_BITS, max_distance // BLOCK_COUNT)
+        self._tables = [{} for _ in range(BLOCK_COUNT)]
+        # 哈希 -> 使用该哈希的笔记ID集合
+        self._notes_by_hash = {}
+        self._hash_by_note = {}
+
+    def __len__(self):
+        return len(self._hash_by_note)
+
+    def build(self, hashes):
+        """用 [(note_id, dhash), ...] 批量添加"""
+        for note_id, dhash in hashes:
+            self.add(note_id, dhash)
+
+    def add(self, note_id, dhash):
+        with self._lock:
+            if self._hash_by_note.get(note_id) == dhash:
+                return
+            self._remove(note_id)
+            self._hash_by_note[note_id] = dhash
+            notes = self._notes_by_hash.get(dhash)
+            if notes is not None:
+                notes.add(note_id)
+                return
+            self._notes_by_hash[dhash] = {note_id}
+            for table, block in zip(self._tables, self._blocks(dhash)):
+                table.setdefault(block, set()).add(dhash)
+
+    def remove(self, note_id):
+        with self._lock:
+            self._remove(note_id)
+
+    def get(self, note_id):
+        return self._hash_by_note.get(note_id)
+
+    def search(self, dhash, max_distance=None):
+        """返回与dhash距离不超过max_distance的 [(distance, note_id), ...]，按距离从近到远排列"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        masks = self._masks
+        candidates = set()
+        with self._lock:
+            for table, block in zip(self._tables, self._blocks(dhash)):
+                for mask in masks:
+                    hashes = table.get(block ^ mask)
+                    if hashes:
+                        candidates.update(hashes)
+            results = []
+            for candidate in candidates:
+                distance = hamming_distance(dhash, candidate)
+                if distance <= max_distance:
+                    results.extend((distance, note_id) for note_id in self._notes_by_hash[candidate])
+        results.sort()
+        return results
+
+    def _blocks(self, dhash):
+        mask = (1 << BLOCK_BITS) - 1
+        return [(dhash >> (index * BLOCK_BITS)) & mask for index in range(BLOCK_COUNT)]
+
+    def _remove(self, note_id):
+        dhash = self._hash_by_note.pop(note_id, None)
+        if dhash is None:
+            return
+        notes = self._notes_by_hash[dhash]
+        notes.discard(note_id)
+        if notes:
+            return
+        del self._notes_by_hash[dhash]
+        for table, block in zip(self._tables, self._blocks(dhash)):
+            hashes = table[block]
+            hashes.discard(dhash)
+            if not hashes:
+                del table[block]
@@ -0,0 +1,99 @@
+import io
+import struct
+from PIL import Image
+
+# 截图保存时预先生成的缩略图尺寸（长边像素），预览时选用能填满预览区的最小一张
+RENDITION_SIZES = (256, 800, 1600)
+# 缩略图与原图大小接近时直接使用原图，不再单独保存
+RENDITION_MIN_REDUCTION = 0.75
+
+
+# 文本笔记内容的MIME类型
+TEXT_MIME_TYPE = 'text/plain; charset=utf-8'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# 感知哈希的边长，dHash比较每行相邻的像素，得到 DHASH_SIZE * DHASH_SIZE 位
+DHASH_SIZE = 8
+
+
+def image_info(data):
+    """返回图片数据的 (mime类型, 宽, 高)
+
+    PNG直接读取文件头中的IHDR，不需要解码图片；其他格式交给PIL识别
+    """
+    if data[:8] == PNG_SIGNATURE and data[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', data[16:24])
+        return 'image/png', width, height
+    try:
+        img = Image.open(io.BytesIO(data))
+        return Image.MIME.get(img.format, 'application/octet-stream'), img.width, img.height
+    except Exception:
+        return 'application/octet-stream', None, None
+
+
+def encode_png(img):
+    """在内存中把PIL图片编码为PNG数据"""
+    output = io.BytesIO()
+    img.save(output, 'PNG')
+    return output.getvalue()
+
+
+def fit_image(img, width, height, fast=False):
+    """等比例缩放图片，使其完整显示在 width x height 的区域内"""
+    if width <= 1 or height <= 1: # 避免除以零或负数
+        return img
+    
+    original_width, original_height = img.size
+    
+    # 选择较小的比例以确保图片完全显示
+    ratio = min(width / original_width, height / original_height)
+    
+    new_width = int(original_width * ratio)
+    new_height = int(original_height * ratio)
+    
+    if fast:
+        # 先按整数倍缩小再双线性插值，速度快但质量稍差
+        return img.resize((new_width, new_height), Image.BILINEAR, reducing_gap=2.0)
+    return img.resize((new_width, new_height), Image.LANCZOS)
+
+
+def build_renditions(content, sizes=RENDITION_SIZES):
+    """根据原图PNG数据生成多级缩略图，返回 [(size, width, height, png数据), ...]
+
+    只生成明显比原图小的尺寸；原图比最小的尺寸还小时返回空列表，预览时直接使用原图
+    """
+    img = Image.open(io.BytesIO(content))
+    # 打开图片时只读取了文件头，不需要缩略图时不必解码
+    long_edge = max(img.size)
+    targets = [size for size in sizes if size < long_edge * RENDITION_MIN_REDUCTION]
+    if not targets:
+        return []
+    img.load()
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+
+    renditions = []
+    # 从大到小依次缩放，每一级都在上一级的基础上缩小，减少计算量
+    source = img
+    for size in sorted(targets, reverse=True):
+        ratio = min(size / long_edge, 1)
+        new_size = (max(int(img.width * ratio), 1), max(int(img.height * ratio), 1))
+        if new_size != source.size:
+            source = source.resize(new_size, Image.LANCZOS, reducing_gap=3.0)
+        renditions.append((size, source.width, source.height, encode_png(source)))
+    return renditions
+
+
+def image_dhash(data):
+    """计算图片数据的dHash，返回64位无符号整数
+
+    图片缩小为9x8的灰度图后比较每行相邻像素的亮度，缩放、压缩和轻微修改后哈希基本不变，
+    两张图片哈希的汉明距离越小越相似
+    """
+    # numpy导入较慢，只在后台计算哈希时才需要
+    import numpy as np
+    img = Image.open(io.BytesIO(data))
+    img.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))
+    img = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(img, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
@@ -0,0 +1,204 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from db_operations import MAINTAINED_TABLES
+
+# 窗口隐藏到托盘后等待多久才开始维护（毫秒）
+MAINTENANCE_IDLE_DELAY_MS = 60 * 1000
+# 每个时间片最多运行的时间，和两个时间片之间的停顿（秒）
+MAINTENANCE_SLICE = 0.2
+MAINTENANCE_PAUSE = 0.5
+# 每次合并全文索引时最多写入的页数
+FTS_MERGE_PAGES = 64
+# 各项维护的最短间隔（秒），同一次运行期间不会重复执行得太频繁
+MIGRATION_INTERVAL = 10 * 60
+ANALYZE_INTERVAL = 24 * 60 * 60
+FTS_MERGE_INTERVAL = 24 * 60 * 60
+VACUUM_INTERVAL = 10 * 60
+CHECKPOINT_INTERVAL = 10 * 60
+INTEGRITY_CHECK_INTERVAL = 7 * 24 * 60 * 60
+
+
+class MaintenanceScheduler:
+    """程序在托盘中空闲时，在后台线程中分时间片进行数据库维护
+
+    包括执行启动时推迟的数据库迁移、合并WAL、释放空闲页、更新查询计划的统计信息、
+    合并全文索引的段和检查表结构。每项任务拆成很短的步骤，每个时间片之间停顿一下；
+    窗口显示或者按下快捷键时调用interrupt()，正在执行的SQL语句会被中断，
+    没做完的任务下次空闲时重新开始
+    """
+
+    def __init__(self, root, db, idle_delay_ms=MAINTENANCE_IDLE_DELAY_MS):
+        self.root = root
+        self.db = db
+        self.idle_delay_ms = idle_delay_ms
+        self.tasks = (
+            # 启动时推迟的迁移（整理数据库以启用incremental_vacuum）最先执行；
+            # 合并全文索引会空出一些页，放在释放空闲页之前；最后合并WAL，让数据库文件变小
+            ('migrate', MIGRATION_INTERVAL, self._migrate),
+            ('analyze', ANALYZE_INTERVAL, self._analyze),
+            ('fts_merge', FTS_MERGE_INTERVAL, self._merge_search_index),
+            ('vacuum', VACUUM_INTERVAL, self._vacuum),
+            ('checkpoint', CHECKPOINT_INTERVAL, self._checkpoint),
+            ('integrity_check', INTEGRITY_CHECK_INTERVAL, self._integrity_check),
+        )
+        # 每项任务上次完成的时间和结果 {名称: (时间, 结果)}
+        self.results = {}
+        self._job = None
+        self._generation = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._closed = False
+        # 维护线程一直存在，只使用一个数据库连接
+        self._thread = threading.Thread(target=self._loop, name='FastNoteMaintenance', daemon=True)
+        self._thread.start()
+
+    def on_idle(self):
+        """窗口隐藏到托盘时在主线程中调用，等待一段时间后开始维护"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+        self._job = self.root.after(self.idle_delay_ms, self._start, generation)
+
+    def interrupt(self):
+        """停止正在进行的维护，可以在任何线程中调用（例如快捷键的监听线程）"""
+        with self._lock:
+            self._generation += 1
+            conn = self._conn
+        self._stop.set()
+        if conn is not None:
+            # 中断当前连接上正在执行的语句，语句会抛出 OperationalError: interrupted
+            conn.interrupt()
+
+    def close(self):
+        self._closed = True
+        self.interrupt()
+        self._wake.set()
+
+    def _start(self, generation):
+        self._job = None
+        # 期间有过操作，或者窗口已经重新显示
+        if generation != self._generation or self.root.winfo_viewable():
+            return
+        self._stop.clear()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            with self._lock:
+                self._conn = self.db.get_connection()
+            try:
+                self._run_tasks()
+            except sqlite3.OperationalError as e:
+                if 'interrupted' not in str(e):
+                    print(f"数据库维护失败: {e}")
+            except sqlite3.Error as e:
+                print(f"数据库维护失败: {e}")
+
+    def _run_tasks(self):
+        slice_started = time.perf_counter()
+        for name, interval, task in self.tasks:
+            last = self.results.get(name)
+            if last is not None and time.time() - last[0] < interval:
+                continue
+            result = None
+            for result in task():
+                if self._stop.is_set():
+                    return
+                # 时间片用完后停顿一下，停顿期间被打断则直接返回
+                if time.perf_counter() - slice_started >= MAINTENANCE_SLICE:
+                    if self._stop.wait(MAINTENANCE_PAUSE):
+                        return
+                    slice_started = time.perf_counter()
+            self.results[name] = (time.time(), result)
+
+    def _migrate(self):
+        # 迁移不能分步执行，被中断时回滚，user_version不变，下次空闲时重新执行
+        if not self.db.has_pending_migrations():
+            yield "无需执行"
+            return
+        self.db.migrate(self.db.get_connection(), deferred=True)
+        yield "完成"
+
+    def _checkpoint(self):
+        busy, log_pages, checkpointed = self.db.checkpoint()
+        yield f"合并 {checkpointed}/{log_pages} 页" + ("（有读写未完成）" if busy else "")
+
+    def _vacuum(self):
+        before = remaining = self.db.get_connection().execute('PRAGMA freelist_count').fetchone()[0]
+        while remaining:
+            previous, remaining = remaining, self.db.incremental_vacuum()
+            yield f"释放 {before - remaining} 页"
+            # 还没有转换为auto_vacuum=INCREMENTAL时释放不了空闲页
+            if remaining >= previous:
+                break
+        if not before:
+            yield "没有空闲页"
+
+    def _analyze(self):
+        for table in MAINTAINED_TABLES:
+            self.db.analyze(table)
+            yield "完成"
+
+    def _merge_search_index(self):
+        steps = 1
+        while self.db.merge_search_index(FTS_MERGE_PAGES):
+            yield f"合并 {steps} 次"
+            steps += 1
+        yield f"合并 {steps} 次"
+
+    def _integrity_check(self):
+        problems = []
+        for table in MAINTAINED_TABLES:
+            problems.extend(self.db.quick_check(table))
+            yield f"发现 {len(problems)} 个问题" if problems else "正常"
+        for problem in problems:
+            print(f"数据库检查发现问题: {problem}")
+
+    def describe(self):
+        """返回每项维护上次完成的时间和结果，用于在统计窗口中显示"""
+        lines = []
+        for name, interval, task in self.tasks:
+            last = self.results.get(name)
+            if last is None:
+                lines.append(f"{name:<18}尚未执行")
+            else:
+                at = datetime.fromtimestamp(last[0]).strftime('%m-%d %H:%M')
+                lines.append(f"{name:<18}{at}  {last[1]}")
+        return lines
+
+
+def _mb(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+def format_storage_stats(stats):
+    """把DatabaseManager.get_storage_stats()的结果整理为显示用的文字行"""
+    lines = [
+        f"数据库文件 {_mb(stats['file_size'])}，WAL {_mb(stats['wal_size'])}",
+        f"页大小 {stats['page_size']} 字节，共 {stats['page_count']} 页，"
+        f"空闲 {stats['freelist_count']} 页（{_mb(stats['freelist_count'] * stats['page_size'])}）",
+        "",
+        "按笔记类型：",
+    ]
+    for note_type, count, size, stored in stats['types']:
+        lines.append(f"  {note_type:<8}{count:>8} 条  内容 {_mb(size):>10}  去重后 {_mb(stored):>10}")
+    count, size = stats['renditions']
+    lines.append(f"  {'缩略图':<6}{count:>8} 个  {_mb(size):>15}")
+    lines.append("")
+    if stats['tables'] is None:
+        lines.append("当前的SQLite不支持dbstat，无法统计各表的空间")
+    else:
+        lines.append("表和索引：")
+        for name, pages, size, unused in stats['tables']:
+            lines.append(f"  {name:<36}{pages:>8} 页  {_mb(size):>10}  未使用 {_mb(unused):>10}")
+    return lines
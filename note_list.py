@@ -0,0 +1,256 @@
+import tkinter as tk
+
+# Treeview中最多同时保留的行数，超出后丢弃离视口最远的一端
+MAX_ROWS = 300
+# 滚动到距离边缘多少比例以内时加载下一页
+LOAD_THRESHOLD = 0.1
+
+
+class VirtualNoteList:
+    """笔记列表的虚拟化视图
+
+    Treeview只保留视口附近的几页笔记，滚动或用j/k移动到边缘时，
+    按 (updated_at, id) 键集分页从数据库加载相邻的一页。
+    搜索结果条数有上限，直接整体显示。
+    """
+
+    def __init__(self, tree, scrollbar, db, page_size=None, max_rows=MAX_ROWS):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.db = db
+        self.page_size = page_size or max_rows // 3
+        self.max_rows = max_rows
+        # item id -> 笔记行 (id, title, created_at, updated_at, note_type)
+        self.rows = {}
+        # item id -> 当前显示的列值，用于判断是否需要更新
+        self._values = {}
+        # 是否处于分页浏览模式（搜索结果模式下不再分页加载）
+        self.paging = False
+        self.has_more_after = False
+        self.has_more_before = False
+        self._load_pending = False
+        self.tree.configure(yscrollcommand=self._on_scroll)
+
+    def reload(self):
+        """回到列表顶部，重新加载第一页"""
+        self.clear()
+        self.paging = True
+        notes = self.db.iter_notes(limit=self.page_size)
+        self._append(notes)
+        self.has_more_after = len(notes) == self.page_size
+        self.has_more_before = False
+
+    def start_streaming(self):
+        """清空列表并进入分页浏览模式，之后由后台加载的笔记通过extend()逐批追加"""
+        self.clear()
+        self.paging = True
+
+    def extend(self, notes, has_more):
+        """把后台按时间顺序读出的一批笔记接在列表末尾，返回是否还需要后续的批次
+
+        列表已满时不再插入，剩下的等滚动到底部时再分页加载；
+        已经显示或比列表最后一行更新的笔记（例如刚保存的笔记、滚动时已加载的页）被跳过。
+        列表不在分页浏览模式或顶部已经被裁掉时不做任何事
+        """
+        if not self.paging or self.has_more_before:
+            return False
+        # 先判断剩余空间，列表已满时不再逐条检查这一批笔记
+        children = self.tree.get_children()
+        room = self.max_rows - len(children)
+        if room <= 0:
+            self.has_more_after = self.has_more_after or bool(notes) or has_more
+            return False
+        if children:
+            last = self.rows[children[-1]]
+            last_key = (last[3], last[0])
+            notes = [note for note in notes
+                     if (note[3], note[0]) < last_key and str(note[0]) not in self.rows]
+        self._append(notes[:room])
+        self.has_more_after = len(notes) > room or has_more
+        return len(notes) < room and has_more
+
+    def show_rows(self, notes, display_values=None):
+        """显示一组固定的笔记（例如搜索结果），不再分页加载
+
+        与当前显示的行做差异更新：删除不再出现的行，只修改内容变化的行，
+        逐字输入搜索词时结果通常只是上一次的子集，几乎不需要插入新行
+        """
+        if self.paging:
+            self.clear()
+        self.paging = False
+        self.has_more_after = self.has_more_before = False
+        if display_values is None:
+            display_values = [(note[0], note[1], note[4], note[2], note[3]) for note in notes]
+        new_items = [str(note[0]) for note in notes]
+        keep = set(new_items)
+        stale = [item for item in self.tree.get_children() if item not in keep]
+        if stale:
+            self._drop(stale)
+        
+        current = self.tree.get_children()
+        position = 0
+        moved = set()
+        for index, item in enumerate(new_items):
+            # 跳过已经被移动到前面的行
+            while position < len(current) and current[position] in moved:
+                position += 1
+            values = tuple(display_values[index])
+            if position < len(current) and current[position] == item:
+                position += 1
+            elif item in self.rows:
+                self.tree.move(item, "", index)
+                moved.add(item)
+            else:
+                self._insert(index, notes[index], values)
+                continue
+            if self._values.get(item) != values:
+                self._set_values(item, values)
+            self.rows[item] = notes[index]
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self.rows.clear()
+        self._values.clear()
+        self.has_more_after = self.has_more_before = False
+
+    def upsert_note(self, note):
+        """新增或修改了一条笔记后增量更新列表，不重建其余的行
+
+        分页浏览且显示的是最新一页时，把该笔记放到最上面；
+        搜索结果中只更新已经显示的那一行。选中项和滚动位置保持不变。
+        """
+        item = str(note[0])
+        exists = self.tree.exists(item)
+        if not self.paging:
+            if exists:
+                old_values = self._values[item]
+                # 保留搜索结果中带高亮的标题，只有标题本身改变时才替换
+                title = old_values[1] if self.rows[item][1] == note[1] else note[1]
+                self._set_values(item, (note[0], title, note[4], note[2], note[3]))
+                self.rows[item] = note[:5] + tuple(self.rows[item][5:])
+            return
+        if self.has_more_before:
+            # 视口不在列表顶部，新的笔记等向上滚动时再加载
+            if exists:
+                self._drop((item,))
+            return
+        top = self._top_index()
+        if exists:
+            was_above = self.tree.index(item) < top
+            self.tree.move(item, "", 0)
+            self._set_values(item, (note[0], note[1], note[4], note[2], note[3]))
+            self.rows[item] = note
+            if not was_above and top > 0:
+                top += 1
+        else:
+            self._insert(0, note)
+            if top > 0:
+                top += 1
+            # 超出上限时丢弃最底部的一行
+            children = self.tree.get_children()
+            if len(children) > self.max_rows:
+                self._drop(children[self.max_rows:])
+                self.has_more_after = True
+        if top > 0:
+            self._scroll_to_index(top)
+
+    def remove_notes(self, note_ids):
+        """从列表中移除已删除的笔记"""
+        items = [str(note_id) for note_id in note_ids if self.tree.exists(str(note_id))]
+        if items:
+            self._drop(items)
+
+    def load_next(self):
+        """在列表末尾加载更旧的一页，返回是否加载到了新行"""
+        children = self.tree.get_children()
+        if not self.paging or not self.has_more_after or not children:
+            return False
+        last = self.rows[children[-1]]
+        notes = self.db.iter_notes(after=(last[3], last[0]), limit=self.page_size)
+        self.has_more_after = len(notes) == self.page_size
+        if not notes:
+            return False
+        top = self._top_index()
+        self._append(notes)
+        # 超出上限时丢弃顶部的行，并保持视口停留在原来的笔记上
+        overflow = len(self.tree.get_children()) - self.max_rows
+        if overflow > 0:
+            self._drop(self.tree.get_children()[:overflow])
+            self.has_more_before = True
+            top = max(top - overflow, 0)
+        self._scroll_to_index(top)
+        return True
+
+    def load_prev(self):
+        """在列表顶部加载更新的一页，返回是否加载到了新行"""
+        children = self.tree.get_children()
+        if not self.paging or not self.has_more_before or not children:
+            return False
+        first = self.rows[children[0]]
+        notes = self.db.iter_notes(before=(first[3], first[0]), limit=self.page_size)
+        self.has_more_before = len(notes) == self.page_size
+        if not notes:
+            return False
+        top = self._top_index()
+        for note in reversed(notes):
+            self._insert(0, note)
+        top += len(notes)
+        # 超出上限时丢弃底部的行
+        overflow = len(self.tree.get_children()) - self.max_rows
+        if overflow > 0:
+            self._drop(self.tree.get_children()[-overflow:])
+            self.has_more_after = True
+        self._scroll_to_index(top)
+        return True
+
+    def _append(self, notes):
+        for note in notes:
+            self._insert(tk.END, note)
+
+    def _insert(self, index, note, values=None):
+        item = str(note[0])
+        if values is None:
+            values = (note[0], note[1], note[4], note[2], note[3])
+        self.tree.insert("", index, iid=item, values=values)
+        self.rows[item] = note
+        self._values[item] = tuple(values)
+        return item
+
+    def _set_values(self, item, values):
+        self.tree.item(item, values=values)
+        self._values[item] = tuple(values)
+
+    def _drop(self, items):
+        self.tree.delete(*items)
+        for item in items:
+            self.rows.pop(item, None)
+            self._values.pop(item, None)
+
+    def _top_index(self):
+        children = self.tree.get_children()
+        if not children:
+            return 0
+        return round(float(self.tree.yview()[0]) * len(children))
+
+    def _scroll_to_index(self, index):
+        count = len(self.tree.get_children())
+        if count:
+            self.tree.yview_moveto(index / count)
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if not self.paging or self._load_pending:
+            return
+        if (float(last) > 1 - LOAD_THRESHOLD and self.has_more_after) or \
+                (float(first) < LOAD_THRESHOLD and self.has_more_before):
+            # 滚动回调中不直接修改Treeview，留到空闲时再加载
+            self._load_pending = True
+            self.tree.after_idle(self._load_near_viewport)
+
+    def _load_near_viewport(self):
+        self._load_pending = False
+        first, last = self.tree.yview()
+        if float(last) > 1 - LOAD_THRESHOLD:
+            self.load_next()
+        elif float(first) < LOAD_THRESHOLD:
+            self.load_prev()
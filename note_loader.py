@@ -0,0 +1,58 @@
+import threading
+
+# 后台加载时每批读取的笔记数量
+LOAD_BATCH_SIZE = 500
+
+
+class NoteLoader:
+    """在后台线程中按 (updated_at, id) 键集分页读取全部笔记的列表信息
+
+    每读出一批，先在后台线程中调用on_page(notes)（例如建立搜索索引），
+    再通过dispatcher在主线程中调用on_batch(notes, loaded, total, has_more)；
+    调用stop_batches()后不再调用on_batch，只继续调用on_page；
+    全部读完后在主线程中调用on_done(loaded)
+    """
+
+    def __init__(self, db, dispatcher, on_batch, on_done=None, on_page=None,
+                 batch_size=LOAD_BATCH_SIZE):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.on_batch = on_batch
+        self.on_done = on_done
+        self.on_page = on_page
+        self.batch_size = batch_size
+        self._cancelled = threading.Event()
+        # 主线程不再需要后续批次时设置，例如列表已经显示满了
+        self._batches_stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='FastNoteLoader', daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def stop_batches(self):
+        """之后读出的笔记不再发送到主线程，只用于on_page"""
+        self._batches_stopped.set()
+
+    def _run(self):
+        total = self.db.count_notes()
+        loaded = 0
+        after = None
+        while not self._cancelled.is_set():
+            notes = self.db.iter_notes(after=after, limit=self.batch_size)
+            if not notes:
+                break
+            loaded += len(notes)
+            has_more = len(notes) == self.batch_size
+            if self.on_page:
+                self.on_page(notes)
+            if not self._batches_stopped.is_set():
+                self.dispatcher.post(self.on_batch, notes, loaded, max(total, loaded), has_more)
+            if not has_more:
+                break
+            after = (notes[-1][3], notes[-1][0])
+        if self.on_done and not self._cancelled.is_set():
+            self.dispatcher.post(self.on_done, loaded)
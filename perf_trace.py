@@ -0,0 +1,204 @@
+import collections
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# 主线程超过这个时间（毫秒）没有处理事件，记为一次卡顿
+STALL_THRESHOLD_MS = 50
+# 检测卡顿的心跳间隔（毫秒）
+HEARTBEAT_MS = 20
+# 保留的最近跟踪事件数量，超出后丢弃最早的
+MAX_TRACE_EVENTS = 100000
+# 保留的最近卡顿记录数量
+MAX_STALLS = 50
+# 直方图每十倍区间的桶数，最小的桶从1微秒开始
+BUCKETS_PER_DECADE = 20
+
+
+class LatencyHistogram:
+    """对数刻度的耗时直方图，内存占用固定，分位数的误差在一个桶宽（约12%）以内"""
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.buckets[self._bucket(ms)] += 1
+
+    def percentile(self, p):
+        """返回第p百分位数的耗时（毫秒），取所在桶的上界"""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(self._upper_bound(bucket), self.max_ms)
+        return self.max_ms
+
+    def _bucket(self, ms):
+        if ms <= 0.001:
+            return 0
+        return int(math.log10(ms / 0.001) * BUCKETS_PER_DECADE) + 1
+
+    def _upper_bound(self, bucket):
+        return 0.001 * 10 ** (bucket / BUCKETS_PER_DECADE)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Tracer:
+    """热点路径的耗时跟踪，默认关闭
+
+    关闭时wrap()直接返回原函数、span()返回空操作，没有额外开销。
+    开启后记录每个操作的耗时直方图，并保留最近的事件用于导出Chrome跟踪文件
+    （chrome://tracing 或 https://ui.perfetto.dev 中打开）
+    """
+
+    def __init__(self, enabled=False, max_events=MAX_TRACE_EVENTS):
+        self.enabled = enabled
+        self.histograms = {}
+        self.events = collections.deque(maxlen=max_events)
+        self.stalls = collections.deque(maxlen=MAX_STALLS)
+        self.started_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """with tracer.span('名称'): ... 记录代码块的耗时"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def wrap(self, func, name):
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, start, time.perf_counter_ns())
+        return traced
+
+    def instrument(self, obj, names, prefix):
+        """把obj上的方法替换为带跟踪的版本，需要在方法被绑定到事件之前调用"""
+        if not self.enabled:
+            return
+        for name in names:
+            setattr(obj, name, self.wrap(getattr(obj, name), f"{prefix}.{name}"))
+
+    def record(self, name, start_ns, end_ns):
+        duration_ms = (end_ns - start_ns) / 1e6
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(duration_ms)
+            self.events.append((name, start_ns, end_ns, threading.get_ident()))
+
+    def record_stall(self, duration_ms):
+        end_ns = time.perf_counter_ns()
+        with self._lock:
+            self.stalls.append((time.strftime('%H:%M:%S'), duration_ms))
+        self.record('tk.stall', end_ns - int(duration_ms * 1e6), end_ns)
+
+    def stats(self):
+        """返回 [(名称, 次数, p50, p99, 最大值, 总耗时), ...]，按总耗时从大到小排列，时间单位为毫秒"""
+        with self._lock:
+            rows = [(name, h.count, h.percentile(50), h.percentile(99), h.max_ms, h.total_ms)
+                    for name, h in self.histograms.items()]
+        rows.sort(key=lambda row: -row[5])
+        return rows
+
+    def recent_stalls(self):
+        with self._lock:
+            return list(self.stalls)
+
+    def export_chrome_trace(self, path):
+        """把最近的事件写成Chrome trace-event格式的JSON文件"""
+        with self._lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace = {
+            'traceEvents': [{
+                'name': name,
+                'cat': name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': (start - self.started_ns) / 1000,
+                'dur': (end - start) / 1000,
+                'pid': pid,
+                'tid': tid,
+            } for name, start, end, tid in events],
+            'displayTimeUnit': 'ms',
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f)
+        return len(events)
+
+
+class StallMonitor:
+    """用after心跳检测Tk主线程的卡顿
+
+    每隔HEARTBEAT_MS安排一次回调，回调实际执行的时间比预期晚超过阈值时，
+    说明期间主线程在执行其他耗时的代码，没有处理事件
+    """
+
+    def __init__(self, root, tracer, threshold_ms=STALL_THRESHOLD_MS, interval_ms=HEARTBEAT_MS):
+        self.root = root
+        self.tracer = tracer
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self._job = None
+        self._expected = None
+
+    def start(self):
+        self._schedule()
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval_ms / 1000
+        self._job = self.root.after(self.interval_ms, self._beat)
+
+    def _beat(self):
+        late_ms = (time.perf_counter() - self._expected) * 1000
+        if late_ms > self.threshold_ms:
+            self.tracer.record_stall(late_ms)
+        self._schedule()
@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+# 预览图片缓存默认占用的内存上限
+PREVIEW_CACHE_BYTES = 96 * 1024 * 1024
+
+
+def image_bytes(img):
+    """估算一张已解码图片占用的内存"""
+    if img is None:
+        return 0
+    width, height = img.width, img.height
+    # PhotoImage的宽高是方法，PIL图片的宽高是属性
+    if callable(width):
+        width, height = width(), height()
+    return width * height * 4
+
+
+class PreviewCache:
+    """已解码预览图片的LRU缓存，按 (note_id, width, height) 索引
+
+    每一项保存解码后的PIL图片和缩放到预览区大小的PhotoImage，
+    重新选中最近看过的笔记时不需要读数据库，也不需要再解码
+    """
+
+    def __init__(self, max_bytes=PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # note_id -> 该笔记的所有缓存键，用于按笔记失效
+        self._keys_by_note = {}
+        self._lock = threading.Lock()
+
+    def get(self, note_id, width, height):
+        """返回 (image, photo)，没有缓存时返回None"""
+        key = (note_id, width, height)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, note_id, width, height, image, photo=None):
+        key = (note_id, width, height)
+        size = image_bytes(image) + image_bytes(photo)
+        with self._lock:
+            self._remove(key)
+            # 单张图片超过整个缓存上限时不缓存
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (image, photo, size)
+            self._keys_by_note.setdefault(note_id, set()).add(key)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, note_id):
+        """笔记被修改或删除后丢弃它的所有缓存"""
+        with self._lock:
+            for key in list(self._keys_by_note.get(note_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_note.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.current_bytes -= entry[2]
+        keys = self._keys_by_note.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_note[key[0]]
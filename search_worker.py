@@ -0,0 +1,65 @@
+import threading
+
+
+class SearchWorker:
+    """在后台线程中执行搜索，只处理最新的一次请求
+
+    主线程每次输入后调用submit()，请求带有递增的代号；后台线程只执行最新的请求，
+    排队期间被新请求替换的直接丢弃。查询完成后通过dispatcher回到主线程，
+    如果期间又有新的输入或者调用了cancel()，结果也被丢弃，不会覆盖较新的结果
+    """
+
+    def __init__(self, dispatcher, search, on_results):
+        self.dispatcher = dispatcher
+        # search(*args) 在后台线程中执行，on_results(result) 在主线程中调用
+        self.search = search
+        self.on_results = on_results
+        self._generation = 0
+        self._request = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='FastNoteSearch', daemon=True)
+        self._thread.start()
+
+    def submit(self, *args):
+        """提交一次搜索，之前还没有返回的搜索结果都不再显示"""
+        with self._lock:
+            self._generation += 1
+            self._request = (self._generation, args)
+        self._wake.set()
+
+    def cancel(self):
+        """丢弃正在排队或正在执行的搜索的结果，例如清空了搜索框"""
+        with self._lock:
+            self._generation += 1
+            self._request = None
+
+    def stop(self):
+        self._closed = True
+        self.cancel()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            with self._lock:
+                request, self._request = self._request, None
+            if request is None:
+                continue
+            generation, args = request
+            try:
+                result = self.search(*args)
+            except Exception as e:
+                print(f"搜索失败: {e}")
+                continue
+            self.dispatcher.post(self._deliver, generation, result)
+
+    def _deliver(self, generation, result):
+        # 在主线程中执行，期间有过新的请求时丢弃
+        if generation != self._generation:
+            return
+        self.on_results(result)
@@ -0,0 +1,29 @@
+import sys
+import threading
+import time
+
+
+class StartupTimer:
+    """记录启动过程中各阶段完成的时间（从程序开始运行算起，毫秒）
+
+    enabled时每记录一个阶段就输出到标准错误，用于比较冷启动的耗时
+    """
+
+    def __init__(self, started=None, enabled=False):
+        self.started = time.perf_counter() if started is None else started
+        self.enabled = enabled
+        self.marks = []
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        with self._lock:
+            self.marks.append((name, elapsed))
+        if self.enabled:
+            print(f"[启动] {name}: {elapsed:.1f}ms", file=sys.stderr)
+        return elapsed
+
+    def report(self):
+        """返回 {阶段: 毫秒}"""
+        with self._lock:
+            return dict(self.marks)
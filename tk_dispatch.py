@@ -0,0 +1,56 @@
+import collections
+import tkinter as tk
+
+# 主线程检查回调队列的间隔（毫秒）
+POLL_INTERVAL_MS = 20
+# post_now()用来唤醒主线程的虚拟事件
+WAKE_EVENT = '<<DispatcherWake>>'
+
+
+class TkDispatcher:
+    """把后台线程的回调转交给Tk主线程执行
+
+    Tk对象只能在创建它的主线程中访问，后台线程通过post()把回调放进队列，
+    主线程用after定时取出执行。deque的append和popleft是线程安全的，不需要加锁。
+    需要尽快响应的回调（例如全局快捷键）用post_now()，立即唤醒主线程，不等下一次定时检查
+    """
+
+    def __init__(self, root, interval=POLL_INTERVAL_MS):
+        self.root = root
+        self.interval = interval
+        self._queue = collections.deque()
+        self.root.bind(WAKE_EVENT, lambda event: self._drain())
+        self._job = self.root.after(self.interval, self._pump)
+
+    def post(self, callback, *args):
+        """可在任意线程中调用，callback稍后在主线程中执行"""
+        self._queue.append((callback, args))
+
+    def post_now(self, callback, *args):
+        """可在任意线程中调用，callback放进队列后立即唤醒主线程执行
+
+        event_generate会由Tcl转交给主线程执行，是tkinter中少数可以在其他线程中调用的操作；
+        主线程还没有进入或已经退出事件循环时抛出异常，此时等定时检查处理
+        """
+        self._queue.append((callback, args))
+        try:
+            self.root.event_generate(WAKE_EVENT, when='tail')
+        except (RuntimeError, tk.TclError):
+            pass
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _pump(self):
+        self._drain()
+        self._job = self.root.after(self.interval, self._pump)
+
+    def _drain(self):
+        while self._queue:
+            callback, args = self._queue.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"主线程回调执行失败: {e}")
@@ -0,0 +1,69 @@
+import queue
+import threading
+
+
+class WriteWorker:
+    """单线程的后台写入队列
+
+    图片编码和数据库写入都在后台线程中按提交顺序执行，Tk主线程不会被阻塞；
+    完成或失败后通过TkDispatcher在主线程中回调
+    """
+
+    def __init__(self, dispatcher, on_status=None):
+        self.dispatcher = dispatcher
+        # on_status(pending, failures) 在队列长度或失败次数变化时于主线程中调用
+        self.on_status = on_status
+        self.failures = 0
+        self.last_error = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='FastNoteWriter', daemon=True)
+        self._thread.start()
+
+    def submit(self, job, on_done=None, on_error=None):
+        """提交一个写入任务，job在后台线程中执行
+
+        on_done(result) 和 on_error(exception) 在主线程中调用
+        """
+        with self._lock:
+            self._pending += 1
+        self._queue.put((job, on_done, on_error))
+        self._report_status()
+
+    def pending(self):
+        """尚未完成的任务数量（包括正在执行的）"""
+        with self._lock:
+            return self._pending
+
+    def stop(self, timeout=None):
+        """等待已提交的任务执行完毕后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            job, on_done, on_error = item
+            try:
+                result = job()
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    self.last_error = e
+                print(f"后台写入失败: {e}")
+                if on_error:
+                    self.dispatcher.post(on_error, e)
+            else:
+                if on_done:
+                    self.dispatcher.post(on_done, result)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                self._report_status()
+
+    def _report_status(self):
+        if self.on_status:
+            self.dispatcher.post(self.on_status, self.pending(), self.failures)